@@ -0,0 +1,82 @@
+import os
+import time
+import asyncio
+import hashlib
+
+import numpy as np
+from fastapi import FastAPI, Request
+
+
+# Simulated provider latency, so the load test exercises the app and not the stub
+STUB_CHAT_LATENCY_MS = float(os.getenv("STUB_CHAT_LATENCY_MS", "400"))
+STUB_EMBED_LATENCY_MS = float(os.getenv("STUB_EMBED_LATENCY_MS", "50"))
+STUB_EMBED_DIM = int(os.getenv("STUB_EMBED_DIM", "3072"))
+
+app = FastAPI()
+
+
+def fake_embedding(text: str, dim: int = STUB_EMBED_DIM) -> list:
+    """
+    Build a deterministic unit vector from the text, so identical texts
+    always land on the same point and retrieval stays stable across runs.
+    """
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+    return vector.tolist()
+
+
+def usage(prompt: str, completion: str = "") -> dict:
+    prompt_tokens = max(1, len(prompt) // 4)
+    completion_tokens = len(completion) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    await asyncio.sleep(STUB_CHAT_LATENCY_MS / 1000)
+
+    prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+    answer = f"Respuesta simulada ({len(prompt)} caracteres de contexto)."
+    return {
+        "id": f"chatcmpl-stub-{time.time_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": answer},
+            "finish_reason": "stop",
+        }],
+        "usage": usage(prompt, answer),
+    }
+
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    await asyncio.sleep(STUB_EMBED_LATENCY_MS / 1000)
+
+    inputs = body.get("input", [])
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    dim = int(body.get("dimensions") or STUB_EMBED_DIM)
+    return {
+        "object": "list",
+        "data": [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(str(text), dim)}
+            for i, text in enumerate(inputs)
+        ],
+        "model": body.get("model", "stub"),
+        "usage": usage(" ".join(str(text) for text in inputs)),
+    }
+
+
+@app.get("/v1/models")
+def models():
+    return {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]}
@@ -0,0 +1,519 @@
+"""
+Replay recorded RAG API traffic against a running server and report
+throughput, latency percentiles, error rates and the saturation point.
+
+Each line of the log is a JSON object:
+
+    {"offset": 0.0, "method": "GET", "path": "/v1/rag/query",
+     "params": {"q": "...", "collection_name": "..."}}
+    {"offset": 1.5, "method": "POST", "path": "/v1/rag/upload",
+     "form": {"collection_name": "...", "loader": "pymupdf"}, "file": "data/test.pdf"}
+
+`offset` is the arrival time in seconds since the start of the recording.
+
+Usage:
+    python -m bench.replay --log bench/sample_requests.jsonl --local --sweep 1,2,4,8
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import httpx
+
+
+@dataclass
+class ReplayRequest:
+    offset: float
+    method: str
+    path: str
+    params: dict = field(default_factory=dict)
+    form: dict = field(default_factory=dict)
+    file: Optional[str] = None
+    file_bytes: Optional[bytes] = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.method} {self.path}"
+
+
+@dataclass
+class ReplayResult:
+    name: str
+    status: int
+    latency: float
+    error: Optional[str] = None
+
+
+def load_log(path: str) -> List[ReplayRequest]:
+    """
+    Load a JSONL request log, resolving upload files relative to the log.
+
+    Args:
+        path: The path to the JSONL log.
+
+    Returns:
+        The requests sorted by their recorded offset.
+    """
+    base_dir = os.path.dirname(os.path.abspath(path))
+    file_cache = {}
+    requests = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            raw = json.loads(line)
+            if "path" not in raw:
+                raise ValueError(f"{path}:{line_number}: missing 'path'")
+            request = ReplayRequest(
+                offset=float(raw.get("offset", 0.0)),
+                method=raw.get("method", "GET").upper(),
+                path=raw["path"],
+                params=raw.get("params", {}),
+                form=raw.get("form", {}),
+                file=raw.get("file"),
+            )
+            if request.file:
+                file_path = request.file
+                if not os.path.isabs(file_path) and not os.path.exists(file_path):
+                    file_path = os.path.join(base_dir, file_path)
+                if file_path not in file_cache:
+                    with open(file_path, "rb") as pdf:
+                        file_cache[file_path] = pdf.read()
+                request.file_bytes = file_cache[file_path]
+            requests.append(request)
+    requests.sort(key=lambda r: r.offset)
+    return requests
+
+
+async def send(client: httpx.AsyncClient, request: ReplayRequest, started: Optional[float] = None) -> ReplayResult:
+    """
+    Send one request. In open-loop mode `started` is the scheduled arrival
+    time, so time spent queued behind the concurrency limit counts as latency.
+    """
+    started = time.perf_counter() if started is None else started
+    kwargs = {"params": request.params}
+    if request.method != "GET":
+        kwargs["data"] = request.form
+        if request.file_bytes is not None:
+            file_name = os.path.basename(request.file)
+            kwargs["files"] = {"file": (file_name, request.file_bytes, "application/pdf")}
+    try:
+        response = await client.request(request.method, request.path, **kwargs)
+        error = None if response.status_code < 400 else response.text[:200]
+        return ReplayResult(request.name, response.status_code, time.perf_counter() - started, error)
+    except httpx.TimeoutException as e:
+        return ReplayResult(request.name, 0, time.perf_counter() - started, f"client timeout: {e!r}")
+    except httpx.HTTPError as e:
+        return ReplayResult(request.name, -1, time.perf_counter() - started, repr(e))
+
+
+async def run_closed(client, requests, concurrency: int, loops: int = 1, duration: float = None, think_time: float = 0.0):
+    """
+    Closed loop: `concurrency` virtual users each send the next request as
+    soon as their previous one completes. Recorded offsets are ignored.
+    """
+    queue = asyncio.Queue()
+    for _ in range(loops):
+        for request in requests:
+            queue.put_nowait(request)
+    results = []
+    deadline = time.perf_counter() + duration if duration else None
+
+    async def user():
+        while not queue.empty():
+            if deadline and time.perf_counter() >= deadline:
+                return
+            request = queue.get_nowait()
+            results.append(await send(client, request))
+            if think_time:
+                await asyncio.sleep(think_time)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    return results, time.perf_counter() - started
+
+
+def open_schedule(requests, rate: float = None, time_scale: float = 1.0, loops: int = 1,
+                  duration: float = None, seed: int = 0) -> List[tuple]:
+    """
+    Arrival times (seconds from the start) of an open-loop run. With `rate`
+    arrivals are Poisson at that many requests per second, otherwise the
+    recorded offsets are replayed divided by `time_scale`.
+    """
+    rng = random.Random(seed)
+    schedule = []
+    t = 0.0
+    span = (requests[-1].offset - requests[0].offset) if requests else 0.0
+    for loop in range(loops):
+        for request in requests:
+            if rate:
+                t += rng.expovariate(rate)
+                at = t
+            else:
+                at = (loop * (span + 1.0) + request.offset - requests[0].offset) / time_scale
+            if duration and at > duration:
+                break
+            schedule.append((at, request))
+    return schedule
+
+
+def offered_rate(schedule: List[tuple]) -> Optional[float]:
+    """
+    Arrival rate (requests per second) of a schedule, None when every request
+    arrives at once.
+    """
+    span = schedule[-1][0] - schedule[0][0] if schedule else 0.0
+    return (len(schedule) - 1) / span if span > 0 else None
+
+
+async def run_open(client, schedule: List[tuple], max_in_flight: int = 256):
+    """
+    Open loop: requests arrive on `schedule` (see open_schedule) regardless of
+    how fast the server answers.
+    """
+    semaphore = asyncio.Semaphore(max_in_flight)
+    started = time.perf_counter()
+
+    async def arrive(at, request):
+        await asyncio.sleep(max(0.0, started + at - time.perf_counter()))
+        scheduled = started + at
+        async with semaphore:
+            return await send(client, request, started=scheduled)
+
+    results = await asyncio.gather(*(arrive(at, request) for at, request in schedule))
+    return list(results), time.perf_counter() - started
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank percentile
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(results: List[ReplayResult], elapsed: float, server_timeout: float) -> dict:
+    """
+    Aggregate a run into throughput, latency percentiles and error counts.
+    A 5xx that took at least `server_timeout` is counted as the server-side
+    `TIMEOUT` firing.
+    """
+    def stats(items):
+        latencies = sorted(r.latency for r in items)
+        errors = [r for r in items if r.error]
+        return {
+            "requests": len(items),
+            "errors": len(errors),
+            "error_rate": round(len(errors) / len(items), 4) if items else 0.0,
+            "p50": round(percentile(latencies, 50), 4),
+            "p90": round(percentile(latencies, 90), 4),
+            "p95": round(percentile(latencies, 95), 4),
+            "p99": round(percentile(latencies, 99), 4),
+            "max": round(latencies[-1], 4) if latencies else 0.0,
+        }
+
+    status_counts = {}
+    error_counts = {}
+    for r in results:
+        status_counts[str(r.status)] = status_counts.get(str(r.status), 0) + 1
+        if r.error:
+            key = f"{r.name} [{r.status}] {r.error[:120]}"
+            error_counts[key] = error_counts.get(key, 0) + 1
+    summary = stats(results)
+    summary.update({
+        "elapsed": round(elapsed, 3),
+        "throughput": round(len(results) / elapsed, 3) if elapsed else 0.0,
+        "status_counts": status_counts,
+        "client_timeouts": sum(1 for r in results if r.status == 0),
+        "server_timeouts": sum(1 for r in results if r.status >= 500 and r.latency >= server_timeout),
+        "top_errors": sorted(error_counts.items(), key=lambda item: -item[1])[:5],
+        "endpoints": {
+            name: stats([r for r in results if r.name == name])
+            for name in sorted({r.name for r in results})
+        },
+    })
+    return summary
+
+
+def find_saturation(levels: List[dict], mode: str, max_error_rate: float, slo_p95: float = None) -> Optional[dict]:
+    """
+    Return the first sweep level at which the server is saturated: errors
+    exceed the budget, p95 breaks the SLO, or throughput stops following the
+    offered load (closed loop: <10% gain over the previous level; open loop:
+    below 90% of the arrival rate, `offered_rps`; not checked when a replayed
+    log has no arrival rate because every request arrives at once).
+    """
+    previous = None
+    for level in levels:
+        reason = None
+        if level["error_rate"] > max_error_rate:
+            reason = f"error rate {level['error_rate']:.2%} > {max_error_rate:.2%}"
+        elif slo_p95 and level["p95"] > slo_p95:
+            reason = f"p95 {level['p95']:.3f}s > SLO {slo_p95:.3f}s"
+        elif mode == "open" and level["offered_rps"] and level["throughput"] < 0.9 * level["offered_rps"]:
+            reason = f"throughput {level['throughput']:.2f} rps < 90% of offered {level['offered_rps']:.2f} rps"
+        elif mode == "closed" and previous and level["throughput"] < 1.1 * previous["throughput"]:
+            reason = f"throughput {level['throughput']:.2f} rps flat vs {previous['throughput']:.2f} rps"
+        if reason:
+            return {"level": level["level"], "last_good_level": previous["level"] if previous else None, "reason": reason}
+        previous = level
+    return None
+
+
+def measure_import_time(module: str = "main", repeat: int = 3) -> float:
+    """
+    Median wall time of `import <module>` in a fresh interpreter, which is
+    what every uvicorn worker pays on start and on fork.
+    """
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    timings = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()
+        timings.append(float(output[-1]))
+    return sorted(timings)[len(timings) // 2]
+
+
+def print_report(report: dict):
+    print(f"\nMode: {report['mode']}  base_url: {report['base_url']}")
+    if report.get("import_time") is not None:
+        print(f"Import time (main): {report['import_time']:.3f}s")
+    if report.get("startup_time") is not None:
+        print(f"Startup to ready ({report['workers']} worker(s), {report['backend']} backend): {report['startup_time']:.3f}s")
+    header = f"{'level':>7} {'reqs':>6} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'err%':>7} {'srv_to':>7} {'cli_to':>7}"
+    print(header)
+    print("-" * len(header))
+    for level in report["levels"]:
+        print(
+            f"{level['level']:>7} {level['requests']:>6} {level['throughput']:>8.2f} "
+            f"{level['p50']:>8.3f} {level['p95']:>8.3f} {level['p99']:>8.3f} {level['max']:>8.3f} "
+            f"{level['error_rate'] * 100:>6.2f}% {level['server_timeouts']:>7} {level['client_timeouts']:>7}"
+        )
+    for level in report["levels"]:
+        print(f"\nLevel {level['level']} per endpoint:")
+        for name, stats in level["endpoints"].items():
+            print(
+                f"  {name:<32} n={stats['requests']:<5} p50={stats['p50']:.3f}s "
+                f"p95={stats['p95']:.3f}s err={stats['error_rate']:.2%}"
+            )
+        for error, count in level["top_errors"]:
+            print(f"  {count:>4}x {error}")
+    saturation = report["saturation"]
+    if saturation:
+        print(f"\nSaturated at level {saturation['level']} "
+              f"(last good: {saturation['last_good_level']}): {saturation['reason']}")
+    else:
+        print("\nNo saturation detected in the swept range.")
+
+
+class LocalStack:
+    """
+    Start local stand-ins for OpenAI (bench.openai_stub) and Chroma
+    (`chroma run`), then the RAG API itself under uvicorn pointed at both.
+    With an in-process vector store backend no Chroma server is started.
+    """
+    def __init__(self, app_port: int = 8013, stub_port: int = 8014, chroma_port: int = 8015,
+                 workers: int = 1, server_timeout: int = 600, stub_chat_latency_ms: float = None,
+                 backend: str = "http"):
+        self.app_port = app_port
+        self.backend = backend
+        self.stub_port = stub_port
+        self.chroma_port = chroma_port
+        self.workers = workers
+        self.server_timeout = server_timeout
+        self.stub_chat_latency_ms = stub_chat_latency_ms
+        self.processes = []
+        self.chroma_dir = None
+        self.startup_time = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.app_port}"
+
+    def _spawn(self, args, env, ready_url):
+        started = time.perf_counter()
+        process = subprocess.Popen(args, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+        self.processes.append(process)
+        deadline = time.time() + 120
+        while time.time() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{' '.join(args)} exited with {process.returncode}")
+            try:
+                if httpx.get(ready_url, timeout=1.0).status_code < 500:
+                    return time.perf_counter() - started
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.1)
+        raise RuntimeError(f"Timed out waiting for {ready_url}")
+
+    def __enter__(self):
+        try:
+            self._start()
+        except BaseException:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def _start(self):
+        self.chroma_dir = tempfile.TemporaryDirectory(prefix="bench-chroma-")
+        env = dict(os.environ)
+        if self.stub_chat_latency_ms is not None:
+            env["STUB_CHAT_LATENCY_MS"] = str(self.stub_chat_latency_ms)
+        self._spawn(
+            [sys.executable, "-m", "uvicorn", "bench.openai_stub:app", "--port", str(self.stub_port), "--log-level", "warning"],
+            env, f"http://127.0.0.1:{self.stub_port}/v1/models",
+        )
+        if self.backend == "http":
+            self._spawn(
+                ["chroma", "run", "--path", self.chroma_dir.name, "--port", str(self.chroma_port),
+                 "--log-path", os.path.join(self.chroma_dir.name, "chroma.log")],
+                env, f"http://127.0.0.1:{self.chroma_port}/api/v1/heartbeat",
+            )
+        stub_base = f"http://127.0.0.1:{self.stub_port}/v1"
+        env.update({
+            "OPENAI_API_KEY": "sk-stub",
+            "OPENAI_BASE_URL": stub_base,
+            "OPENAI_API_BASE": stub_base,
+            "CHROMA_HOST": "127.0.0.1",
+            "CHROMA_PORT": str(self.chroma_port),
+            "VECTOR_STORE_BACKEND": self.backend,
+            "VECTOR_STORE_PATH": os.path.join(self.chroma_dir.name, "vectors"),
+            "TIMEOUT": str(self.server_timeout),
+        })
+        self.startup_time = self._spawn(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.app_port),
+             "--workers", str(self.workers), "--loop", "asyncio", "--log-level", "warning"],
+            env, f"{self.base_url}/readyz",
+        )
+
+    def __exit__(self, *exc):
+        for process in reversed(self.processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if self.chroma_dir:
+            self.chroma_dir.cleanup()
+
+
+async def run_sweep(args, base_url: str) -> dict:
+    requests = load_log(args.log)
+    if not requests:
+        raise SystemExit(f"No requests in {args.log}")
+    if args.sweep:
+        levels = [float(v) for v in args.sweep.split(",")]
+    else:
+        levels = [args.rate if args.mode == "open" and args.rate else float(args.concurrency)]
+    # Open loop without a rate replays the recorded offsets: one level, at the log's own arrival rate
+    replay_offsets = args.mode == "open" and not (args.sweep or args.rate)
+
+    headers = {"Authorization": f"Bearer {args.token}"}
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, timeout=timeout, limits=limits) as client:
+        for level in levels:
+            if args.mode == "closed":
+                print(f"Running closed loop at level {level:g} ...")
+                run, elapsed = await run_closed(
+                    client, requests, concurrency=int(level), loops=args.loops,
+                    duration=args.duration, think_time=args.think_time,
+                )
+                summary = summarize(run, elapsed, args.server_timeout)
+            else:
+                schedule = open_schedule(
+                    requests, rate=None if replay_offsets else level, time_scale=args.time_scale,
+                    loops=args.loops, duration=args.duration, seed=args.seed,
+                )
+                offered = offered_rate(schedule) if replay_offsets else level
+                if replay_offsets:
+                    level = round(offered, 2) if offered else "replay"
+                print(f"Running open loop at level {level} ...")
+                run, elapsed = await run_open(client, schedule, max_in_flight=args.concurrency)
+                summary = summarize(run, elapsed, args.server_timeout)
+                summary["offered_rps"] = offered
+            summary["level"] = level
+            results.append(summary)
+
+    return {
+        "mode": args.mode,
+        "base_url": base_url,
+        "log": args.log,
+        "levels": results,
+        "saturation": find_saturation(results, args.mode, args.max_error_rate, args.slo_p95),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a JSONL request log against the RAG API.")
+    parser.add_argument("--log", default=os.path.join(os.path.dirname(__file__), "sample_requests.jsonl"))
+    parser.add_argument("--base-url", default="http://localhost:8003")
+    parser.add_argument("--token", default=os.getenv("API_TOKEN", "1234"))
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed",
+                        help="closed: fixed number of concurrent users; open: fixed arrival rate")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="closed: virtual users; open: max in-flight requests")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="open: Poisson arrivals per second (default: replay recorded offsets)")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="open: speed-up factor applied to recorded offsets")
+    parser.add_argument("--sweep", default=None,
+                        help="comma separated levels (concurrency or rate) to find the saturation point")
+    parser.add_argument("--loops", type=int, default=1, help="times to replay the log per level")
+    parser.add_argument("--duration", type=float, default=None, help="stop issuing requests after N seconds")
+    parser.add_argument("--think-time", type=float, default=0.0, help="closed: pause between requests per user")
+    parser.add_argument("--server-timeout", type=float, default=float(os.getenv("TIMEOUT", "600")),
+                        help="server TIMEOUT; 5xx responses at least this slow count as server timeouts")
+    parser.add_argument("--timeout", type=float, default=None, help="client timeout (default: server timeout + 30s)")
+    parser.add_argument("--slo-p95", type=float, default=None, help="p95 latency SLO in seconds")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--local", action="store_true",
+                        help="start the API against local OpenAI and Chroma stand-ins")
+    parser.add_argument("--workers", type=int, default=1, help="--local: uvicorn worker processes")
+    parser.add_argument("--backend", choices=["http", "persistent", "numpy"], default="http",
+                        help="--local: vector store backend (VECTOR_STORE_BACKEND) of the API")
+    parser.add_argument("--stub-chat-latency-ms", type=float, default=None)
+    parser.add_argument("--skip-import-time", action="store_true", help="do not measure `import main` time")
+    parser.add_argument("--output", default=None, help="write the JSON report to this path")
+    args = parser.parse_args(argv)
+    if args.timeout is None:
+        args.timeout = args.server_timeout + 30
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.local:
+        with LocalStack(workers=args.workers, server_timeout=int(args.server_timeout),
+                        stub_chat_latency_ms=args.stub_chat_latency_ms, backend=args.backend) as stack:
+            report = asyncio.run(run_sweep(args, stack.base_url))
+        report["workers"] = args.workers
+        report["backend"] = args.backend
+        report["startup_time"] = round(stack.startup_time, 3)
+    else:
+        report = asyncio.run(run_sweep(args, args.base_url))
+    report["import_time"] = None if args.skip_import_time else round(measure_import_time(), 3)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,14 @@
-import chromadb
-from chromadb.config import Settings
-
 class ChromaDBClient:
-    def __init__(self, host=None, port=None, auth_credentials=None, auth_provider=None, auth_token_transport_header=None):
+    """
+    Chroma backed vector database.
+
+    mode "http" talks to a Chroma server and "persistent" runs Chroma
+    in-process on `path`.
+    """
+    def __init__(self, host=None, port=None, auth_credentials=None, auth_provider=None, auth_token_transport_header=None, mode="http", path=None):
         self.client = None
+        self.mode = mode
+        self.path = path
         self.host = host
         self.port = port 
         self.auth_credentials = auth_credentials
@@ -15,23 +20,41 @@ class ChromaDBClient:
     def get_or_create_collection(self, collection_name):
         return self.client.get_or_create_collection(collection_name)
     
+    def get_vector_store(self, collection_name):
+        from llama_index.vector_stores.chroma import ChromaVectorStore
+        return ChromaVectorStore(chroma_collection=self.get_or_create_collection(collection_name))
+    
     def list_collections(self):
-        collection_names = self.client.list_collections()
+        # chromadb < 0.6 returns Collection objects, newer versions return names
+        collection_names = [
+            c if isinstance(c, str) else c.name
+            for c in self.client.list_collections()
+        ]
         return collection_names
     
+    def heartbeat(self):
+        return self.client.heartbeat()
+    
     def get_or_create_client(self):
         if self.client is None:
-            self.client = chromadb.HttpClient(
-                host=self.host,
-                port=self.port,
-                settings=Settings(
-                    allow_reset=True,
-                    anonymized_telemetry=False,
-                    # chroma_client_auth_provider=self.auth_provider,
-                    # chroma_client_auth_credentials=self.auth_credentials,
-                    # chroma_auth_token_transport_header=self.auth_token_transport_header,
-                )
+            # Imported here so importing this module stays cheap
+            import chromadb
+            from chromadb.config import Settings
+            settings = Settings(
+                allow_reset=True,
+                anonymized_telemetry=False,
+                # chroma_client_auth_provider=self.auth_provider,
+                # chroma_client_auth_credentials=self.auth_credentials,
+                # chroma_auth_token_transport_header=self.auth_token_transport_header,
             )
+            if self.mode == "persistent":
+                self.client = chromadb.PersistentClient(path=self.path, settings=settings)
+            else:
+                self.client = chromadb.HttpClient(
+                    host=self.host,
+                    port=self.port,
+                    settings=settings
+                )
         
         return self.client
     
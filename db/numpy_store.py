@@ -0,0 +1,466 @@
+import io
+import os
+import re
+import json
+import time
+import shutil
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Any, List, Optional
+
+import numpy as np
+
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.jsonl"
+LOCK_FILE = ".lock"
+RELOAD_ATTEMPTS = 3
+# Same rule as Chroma collection names, which also keeps names safe as directory names
+COLLECTION_NAME_RE = re.compile(r"^[a-zA-Z0-9][a-zA-Z0-9._-]{1,61}[a-zA-Z0-9]$")
+
+
+class NumpyCollection:
+    """
+    A flat (brute force) vector collection stored in a directory:
+
+    - embeddings.npy: float32 matrix of unit-normalized embeddings, memory-mapped on load.
+    - records.jsonl: one {"id", "document", "metadata"} line per row, same order.
+
+    Reads work on an immutable snapshot. Reloading it from disk takes a shared
+    file lock, so the records of one write are never paired with the embeddings
+    of another. Writes take the lock exclusively, reload the latest state from
+    disk (another worker may have written), and swap in a new snapshot, so
+    several processes can share a directory. Adding new rows appends them to
+    both files in place; replacing or deleting rows rewrites the collection.
+    The on-disk layout mirrors the subset of the Chroma collection API that
+    the RAG API uses (add/upsert/get/delete/count).
+    """
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._snapshot = self._empty_snapshot()
+        self._reload_if_changed()
+
+    @staticmethod
+    def _empty_snapshot():
+        return {"ids": [], "documents": [], "metadatas": [], "embeddings": None, "index": {}, "records_size": 0}
+
+    def _records_path(self):
+        return os.path.join(self.path, RECORDS_FILE)
+
+    def _embeddings_path(self):
+        return os.path.join(self.path, EMBEDDINGS_FILE)
+
+    def _records_mtime(self):
+        try:
+            stat = os.stat(self._records_path())
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _reload_if_changed(self, locked: bool = False):
+        """
+        Reload the snapshot if another writer changed the files.
+
+        Args:
+            locked: The caller already holds the exclusive file lock.
+        """
+        mtime = self._records_mtime()
+        if mtime is None or mtime == self._mtime:
+            return
+        if locked:
+            self._load()
+            return
+        with open(os.path.join(self.path, LOCK_FILE), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH)
+            try:
+                self._load()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self):
+        # The lock keeps both files from the same write; still check, in case
+        # a writer doesn't honour it (e.g. on a filesystem without flock)
+        for _ in range(RELOAD_ATTEMPTS):
+            mtime = self._records_mtime()
+            ids, documents, metadatas = [], [], []
+            records_size = 0
+            with open(self._records_path(), "rb") as f:
+                for line in f:
+                    # A line without its newline is from an interrupted append
+                    if not line.endswith(b"\n"):
+                        break
+                    records_size += len(line)
+                    record = json.loads(line)
+                    ids.append(record["id"])
+                    documents.append(record["document"])
+                    metadatas.append(record["metadata"])
+            embeddings = np.load(self._embeddings_path(), mmap_mode="r") if ids else None
+            if embeddings is None or len(embeddings) == len(ids):
+                break
+            time.sleep(0.01)
+        else:
+            if len(embeddings) < len(ids):
+                raise RuntimeError(
+                    f"Collection '{self.name}' has {len(ids)} records but {len(embeddings)} embeddings"
+                )
+            # Embeddings are appended before their records: extra rows are
+            # from an interrupted append
+            embeddings = embeddings[:len(ids)]
+        self._snapshot = {
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas,
+            "embeddings": embeddings,
+            "index": {node_id: i for i, node_id in enumerate(ids)},
+            "records_size": records_size,
+        }
+        self._mtime = mtime
+
+    @contextmanager
+    def _write_lock(self):
+        with self._lock, open(os.path.join(self.path, LOCK_FILE), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._reload_if_changed(locked=True)
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _persist(self, ids, documents, metadatas, embeddings):
+        # Write both files next to the originals and rename, records last:
+        # readers key their reload on the records file.
+        embeddings_tmp = self._embeddings_path() + ".tmp.npy"
+        records_tmp = self._records_path() + ".tmp"
+        np.save(embeddings_tmp, embeddings)
+        with open(records_tmp, "w") as f:
+            for node_id, document, metadata in zip(ids, documents, metadatas):
+                f.write(json.dumps({"id": node_id, "document": document, "metadata": metadata}) + "\n")
+        os.replace(embeddings_tmp, self._embeddings_path())
+        os.replace(records_tmp, self._records_path())
+        self._mtime = None
+        self._reload_if_changed(locked=True)
+
+    def _append(self, ids, documents, metadatas, vectors) -> bool:
+        """
+        Append new rows to both files in place, embeddings first: readers key
+        their reload on the records file.
+
+        Returns:
+            False if the embeddings file can't grow in place, and nothing was written.
+        """
+        snapshot = self._snapshot
+        count = len(snapshot["ids"])
+        with open(self._embeddings_path(), "r+b") as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                read_header, write_header = np.lib.format.read_array_header_1_0, np.lib.format.write_array_header_1_0
+            elif version == (2, 0):
+                read_header, write_header = np.lib.format.read_array_header_2_0, np.lib.format.write_array_header_2_0
+            else:
+                return False
+            shape, fortran_order, dtype = read_header(f)
+            offset = f.tell()
+            # np.save leaves room in the header for the row count to grow
+            header = io.BytesIO()
+            write_header(header, {
+                "descr": np.lib.format.dtype_to_descr(dtype),
+                "fortran_order": fortran_order,
+                "shape": (count + len(vectors),) + shape[1:],
+            })
+            if fortran_order or dtype != np.float32 or len(shape) != 2 or len(header.getvalue()) != offset:
+                return False
+            # Drop rows left by an interrupted append
+            end = offset + count * shape[1] * dtype.itemsize
+            f.truncate(end)
+            f.seek(end)
+            f.write(vectors.tobytes())
+            f.seek(0)
+            f.write(header.getvalue())
+
+        records = b"".join(
+            json.dumps({"id": node_id, "document": document, "metadata": metadata}).encode() + b"\n"
+            for node_id, document, metadata in zip(ids, documents, metadatas)
+        )
+        with open(self._records_path(), "r+b") as f:
+            f.truncate(snapshot["records_size"])
+            f.seek(snapshot["records_size"])
+            f.write(records)
+
+        # Extend the snapshot rather than re-parse the records
+        index = dict(snapshot["index"])
+        index.update((node_id, count + i) for i, node_id in enumerate(ids))
+        self._snapshot = {
+            "ids": snapshot["ids"] + list(ids),
+            "documents": snapshot["documents"] + list(documents),
+            "metadatas": snapshot["metadatas"] + list(metadatas),
+            "embeddings": np.load(self._embeddings_path(), mmap_mode="r"),
+            "index": index,
+            "records_size": snapshot["records_size"] + len(records),
+        }
+        self._mtime = self._records_mtime()
+        return True
+
+    def count(self) -> int:
+        self._reload_if_changed()
+        return len(self._snapshot["ids"])
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[dict]):
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("Expected one embedding per id")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+
+        with self._write_lock():
+            snapshot = self._snapshot
+            current = snapshot["embeddings"]
+            if current is not None and current.shape[1] != vectors.shape[1]:
+                raise ValueError(
+                    f"Embedding dimension {vectors.shape[1]} does not match collection "
+                    f"'{self.name}' dimension {current.shape[1]}"
+                )
+            new_only = len(set(ids)) == len(ids) and not any(node_id in snapshot["index"] for node_id in ids)
+            if current is not None and new_only and self._append(ids, documents, metadatas, vectors):
+                return
+            all_ids = list(snapshot["ids"])
+            all_documents = list(snapshot["documents"])
+            all_metadatas = list(snapshot["metadatas"])
+            merged = np.array(current) if current is not None else np.empty((0, vectors.shape[1]), np.float32)
+            index = dict(snapshot["index"])
+            new_rows = []
+            for i, node_id in enumerate(ids):
+                if node_id in index:
+                    row = index[node_id]
+                    merged[row] = vectors[i]
+                    all_documents[row] = documents[i]
+                    all_metadatas[row] = metadatas[i]
+                else:
+                    index[node_id] = len(all_ids)
+                    all_ids.append(node_id)
+                    all_documents.append(documents[i])
+                    all_metadatas.append(metadatas[i])
+                    new_rows.append(i)
+            if new_rows:
+                merged = np.vstack([merged, vectors[new_rows]])
+            self._persist(all_ids, all_documents, all_metadatas, merged)
+
+    # Chroma's add() rejects duplicates; here re-adding a node just replaces it
+    add = upsert
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[dict] = None):
+        with self._write_lock():
+            snapshot = self._snapshot
+            if not snapshot["ids"]:
+                return
+            drop = set(ids or [])
+            keep = [
+                i for i, (node_id, metadata) in enumerate(zip(snapshot["ids"], snapshot["metadatas"]))
+                if not (node_id in drop or (where and all(metadata.get(k) == v for k, v in where.items())))
+            ]
+            if len(keep) == len(snapshot["ids"]):
+                return
+            self._persist(
+                [snapshot["ids"][i] for i in keep],
+                [snapshot["documents"][i] for i in keep],
+                [snapshot["metadatas"][i] for i in keep],
+                np.asarray(snapshot["embeddings"])[keep],
+            )
+
+    def get(self, ids: Optional[List[str]] = None, limit: Optional[int] = None, offset: int = 0,
+            include: Optional[List[str]] = None) -> dict:
+        self._reload_if_changed()
+        snapshot = self._snapshot
+        if ids:
+            rows = [snapshot["index"][node_id] for node_id in ids if node_id in snapshot["index"]]
+        else:
+            end = len(snapshot["ids"]) if limit is None else offset + limit
+            rows = list(range(offset, min(end, len(snapshot["ids"]))))
+        include = ["documents", "metadatas"] if include is None else include
+        result = {"ids": [snapshot["ids"][i] for i in rows]}
+        result["documents"] = [snapshot["documents"][i] for i in rows] if "documents" in include else None
+        result["metadatas"] = [snapshot["metadatas"][i] for i in rows] if "metadatas" in include else None
+        if "embeddings" in include:
+            result["embeddings"] = np.asarray(snapshot["embeddings"][rows]) if rows else np.empty((0, 0), np.float32)
+        return result
+
+    def search(self, query_embedding: List[float], top_k: int, filters: Optional[MetadataFilters] = None):
+        """
+        Return (rows, cosine similarities) of the `top_k` best matches.
+        """
+        self._reload_if_changed()
+        snapshot = self._snapshot
+        embeddings = snapshot["embeddings"]
+        if embeddings is None or not len(snapshot["ids"]):
+            return snapshot, [], []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        scores = embeddings @ query
+        if filters is not None:
+            mask = np.fromiter(
+                (_matches(metadata, filters) for metadata in snapshot["metadatas"]),
+                dtype=bool, count=len(snapshot["metadatas"]),
+            )
+            scores = np.where(mask, scores, -np.inf)
+            top_k = min(top_k, int(mask.sum()))
+        top_k = min(top_k, len(scores))
+        if top_k <= 0:
+            return snapshot, [], []
+        rows = np.argpartition(-scores, top_k - 1)[:top_k]
+        rows = rows[np.argsort(-scores[rows])]
+        return snapshot, rows.tolist(), scores[rows].tolist()
+
+
+def _matches(metadata: dict, filters: MetadataFilters) -> bool:
+    results = []
+    for f in filters.filters:
+        if isinstance(f, MetadataFilters):
+            results.append(_matches(metadata, f))
+            continue
+        value = metadata.get(f.key)
+        operator = f.operator
+        if operator == FilterOperator.EQ:
+            results.append(value == f.value)
+        elif operator == FilterOperator.NE:
+            results.append(value != f.value)
+        elif operator == FilterOperator.IN:
+            results.append(value in f.value)
+        elif operator == FilterOperator.NIN:
+            results.append(value not in f.value)
+        elif operator == FilterOperator.GT:
+            results.append(value is not None and value > f.value)
+        elif operator == FilterOperator.GTE:
+            results.append(value is not None and value >= f.value)
+        elif operator == FilterOperator.LT:
+            results.append(value is not None and value < f.value)
+        elif operator == FilterOperator.LTE:
+            results.append(value is not None and value <= f.value)
+        else:
+            raise ValueError(f"Unsupported filter operator for the numpy vector store: {operator}")
+    if filters.condition == FilterCondition.OR:
+        return any(results)
+    return all(results)
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    llama_index vector store over a NumpyCollection.
+    """
+    stores_text: bool = True
+    flat_metadata: bool = True
+
+    _collection: NumpyCollection = PrivateAttr()
+
+    def __init__(self, collection: NumpyCollection, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._collection = collection
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return self._collection
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        ids, embeddings, documents, metadatas = [], [], [], []
+        for node in nodes:
+            metadata = node_to_metadata_dict(node, remove_text=True, flat_metadata=self.flat_metadata)
+            ids.append(node.node_id)
+            embeddings.append(node.get_embedding())
+            documents.append(node.get_content(metadata_mode=MetadataMode.NONE))
+            metadatas.append({k: ("" if v is None else v) for k, v in metadata.items()})
+        self._collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+        return ids
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._collection.delete(where={"document_id": ref_doc_id})
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters: Optional[MetadataFilters] = None, **kwargs: Any) -> None:
+        if filters is not None:
+            snapshot = self._collection.get(include=["metadatas"])
+            node_ids = list(node_ids or []) + [
+                node_id for node_id, metadata in zip(snapshot["ids"], snapshot["metadatas"])
+                if _matches(metadata, filters)
+            ]
+        self._collection.delete(ids=node_ids or [])
+
+    def clear(self) -> None:
+        self._collection.delete(ids=self._collection.get(include=[])["ids"])
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if not query.query_embedding:
+            raise ValueError("The numpy vector store only supports embedding queries")
+        snapshot, rows, similarities = self._collection.search(
+            query.query_embedding, query.similarity_top_k, query.filters
+        )
+        nodes = []
+        for row in rows:
+            node = metadata_dict_to_node(snapshot["metadatas"][row])
+            node.set_content(snapshot["documents"][row])
+            nodes.append(node)
+        return VectorStoreQueryResult(
+            nodes=nodes, similarities=similarities, ids=[snapshot["ids"][row] for row in rows]
+        )
+
+
+class NumpyDBClient:
+    """
+    In-process vector database: one NumpyCollection directory per collection
+    under `path`. Same interface as ChromaDBClient.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(self.path, exist_ok=True)
+        self.collections = {}
+        self._lock = threading.Lock()
+
+    def get_or_create_collection(self, collection_name):
+        if not COLLECTION_NAME_RE.match(collection_name) or ".." in collection_name:
+            raise ValueError(f"Invalid collection name: {collection_name}")
+        with self._lock:
+            if collection_name not in self.collections:
+                self.collections[collection_name] = NumpyCollection(
+                    collection_name, os.path.join(self.path, collection_name)
+                )
+            return self.collections[collection_name]
+
+    def get_vector_store(self, collection_name):
+        return NumpyVectorStore(self.get_or_create_collection(collection_name))
+
+    def list_collections(self):
+        return sorted(
+            name for name in os.listdir(self.path)
+            if os.path.isdir(os.path.join(self.path, name))
+        )
+
+    def delete_collection(self, collection_name: str):
+        collection_path = os.path.join(self.path, collection_name)
+        if not os.path.isdir(collection_path):
+            raise ValueError(f"Collection {collection_name} does not exist.")
+        with self._lock:
+            self.collections.pop(collection_name, None)
+            shutil.rmtree(collection_path)
+
+    def heartbeat(self):
+        return time.time_ns()
@@ -23,6 +23,44 @@ template = (
     "DO NOT END THE ANSWER WITH 'ESPERO QUE TE HAYA SIDO DE AYUDA...' OR SOMETHING LIKE THAT. JUST ANSWER THE QUESTION."
 )
 
+# Precomputed summaries live in a companion collection named <collection><suffix>
+SUMMARY_COLLECTION_SUFFIX = "__summaries"
+
+document_summary_query = (
+    "Summarize this document for someone who has not read it: what it is about, "
+    "its purpose, the main topics it covers and its key conclusions."
+)
+
+collection_summary_query = (
+    "These are summaries of the documents in a collection, each prefixed by its file name. "
+    "Write an overview of the whole collection: what the documents are about, "
+    "their main topics and how they relate to each other."
+)
+
+# Questions that ask what a whole document or collection is about, in English
+# or Spanish. They only match when the question names the document/collection
+# (or nothing at all), so "Summarize the refund policy in section 4" still goes
+# through retrieval.
+overview_subject_en = r"(this|these|that|the)\s+(whole\s+|entire\s+)?(document|doc|file|pdf|paper|report|text|collection)s?"
+overview_subject_es = (
+    r"(de\s+)?(el|la|los|las|este|esta|estos|estas|del)\s+"
+    r"(documento|archivo|pdf|informe|reporte|texto|colecci[oó]n)(e?s)?(\s+(completo|entero)s?)?"
+)
+overview_question_patterns = [
+    rf"\bwhat('s| is| are)\s+({overview_subject_en}|it|this|these)\s+(all\s+)?about\W*$",
+    rf"\b(summary|summarize|summarise|overview|tl;?dr)\s+(of\s+)?{overview_subject_en}\W*$",
+    r"^\W*(please\s+)?(summari[sz]e(\s+(it|this))?|tl;?dr|(give me\s+)?(a\s+|an\s+)?(summary|overview))\W*$",
+    rf"\bmain (idea|topic|point|theme)s?\s+(of|in)\s+{overview_subject_en}\W*$",
+    r"^\W*what('s| is| are)\s+the\s+main (idea|topic|point|theme)s?\W*$",
+    rf"\bde qu[eé] (se\s+)?(trata|habla|va)n?(\s+{overview_subject_es})?\W*$",
+    rf"\b(resumen|res[uú]me(lo)?)(\s+{overview_subject_es})?\W*$",
+    rf"\bidea(s)? principal(es)?(\s+{overview_subject_es})?\W*$",
+]
+
+# The template uses {context}/{question}; the response synthesizers fill
+# {context_str}/{query_str}.
+template_var_mappings = {"context_str": "context", "query_str": "question"}
+
 response_mode_dict = {
     "REFINE": {
         "value": "refine",
@@ -82,4 +120,13 @@ response_mode_dict = {
             "This mode is faster than accumulate since we make fewer calls to the LLM."
         ),
     },
+    "AUTO": {
+        "value": "auto",
+        "description": (
+            "Retrieve more candidates, keep the nodes scoring close to the best one, and pick the cheapest mode "
+            "for their size: compact when the context fits one prompt or the collection's target allows refining, "
+            "tree_summarize when only parallel calls meet the latency target, otherwise drop the lowest-scoring "
+            "nodes until it fits. The response reports the mode chosen and the LLM calls made."
+        ),
+    },
 }
\ No newline at end of file
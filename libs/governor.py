@@ -0,0 +1,321 @@
+"""
+Process-wide governor for outbound LLM and embedding requests.
+
+Every OpenAI client created by RagAPI sends its HTTP requests through a
+GovernedTransport, which takes a token from a shared token bucket before
+each request and retries 429/5xx responses, honouring the provider's
+retry-after headers, and connection errors and timeouts. Requests wait in priority lanes: a lane is only served
+when every higher-priority lane is empty, so interactive queries overtake
+background ingestion.
+
+The lane of a request comes from a context variable, set with use_lane():
+
+    with use_lane(INGESTION_LANE):
+        await rag_api.index_documents(docs, collection_name)
+"""
+import time
+import random
+import asyncio
+import itertools
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+INTERACTIVE_LANE = "interactive"
+INGESTION_LANE = "ingestion"
+# Highest priority first
+LANES = (INTERACTIVE_LANE, INGESTION_LANE)
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+llm_lane = contextvars.ContextVar("llm_lane", default=INTERACTIVE_LANE)
+
+
+@contextmanager
+def use_lane(lane: str):
+    """
+    Send the outbound LLM requests made inside the block through a lane.
+    """
+    if lane not in LANES:
+        raise ValueError(f"Unknown lane: {lane}")
+    token = llm_lane.set(lane)
+    try:
+        yield
+    finally:
+        llm_lane.reset(token)
+
+
+def parse_retry_after(headers) -> float:
+    """
+    Seconds to wait according to the retry-after-ms / retry-after headers,
+    or None when the response doesn't say.
+    """
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+
+class RateGovernor:
+    """
+    Token bucket with priority lanes, shared by sync and async callers.
+
+    Args:
+        requests_per_minute: Sustained request rate, 0 disables the bucket
+            (retries and metrics still apply).
+        burst: Bucket capacity, the requests allowed back to back.
+        max_retries: Retries of a throttled or failed request.
+        base_delay: First backoff delay when there is no retry-after.
+        max_delay: Backoff cap.
+    """
+
+    poll_interval = 0.05
+
+    def __init__(self, requests_per_minute: float = 500, burst: int = 10, max_retries: int = 5,
+                 base_delay: float = 1.0, max_delay: float = 30.0):
+        self.rate = requests_per_minute / 60.0
+        self.burst = max(burst, 1)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.lock = threading.Lock()
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        # A 429 pauses every lane until the provider's retry-after expires
+        self.paused_until = 0.0
+        self.tickets = itertools.count()
+        self.queues = {lane: deque() for lane in LANES}
+        self.stats = {
+            lane: {"requests": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+            for lane in LANES
+        }
+        self.retries = 0
+        self.throttled = 0
+        self.transport_errors = 0
+
+    def _refill(self, now: float):
+        if self.rate > 0:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        else:
+            self.tokens = float(self.burst)
+        self.updated = now
+
+    def _try_acquire(self, lane: str, ticket: int) -> float:
+        """
+        Take a token if this ticket may go now. Returns 0 when acquired,
+        otherwise how long to sleep before trying again.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.paused_until:
+                return self.paused_until - now
+            for higher in LANES[:LANES.index(lane)]:
+                if self.queues[higher]:
+                    return self.poll_interval
+            if self.queues[lane][0] != ticket:
+                return self.poll_interval
+            if self.tokens < 1:
+                return min((1 - self.tokens) / self.rate, self.poll_interval) if self.rate > 0 else 0.0
+            self.tokens -= 1
+            self.queues[lane].popleft()
+            return 0.0
+
+    def _enqueue(self, lane: str) -> int:
+        ticket = next(self.tickets)
+        with self.lock:
+            self.queues[lane].append(ticket)
+        return ticket
+
+    def _dequeue(self, lane: str, ticket: int):
+        with self.lock:
+            if ticket in self.queues[lane]:
+                self.queues[lane].remove(ticket)
+
+    def _record(self, lane: str, waited: float):
+        with self.lock:
+            stats = self.stats[lane]
+            stats["requests"] += 1
+            stats["wait_seconds_total"] += waited
+            stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+
+    def acquire(self, lane: str = None):
+        """
+        Block the calling thread until a request may be sent.
+        """
+        lane = lane or llm_lane.get()
+        started = time.monotonic()
+        ticket = self._enqueue(lane)
+        try:
+            while (delay := self._try_acquire(lane, ticket)) > 0:
+                time.sleep(delay)
+        except BaseException:
+            self._dequeue(lane, ticket)
+            raise
+        self._record(lane, time.monotonic() - started)
+
+    async def aacquire(self, lane: str = None):
+        """
+        Wait, without blocking the event loop, until a request may be sent.
+        """
+        lane = lane or llm_lane.get()
+        started = time.monotonic()
+        ticket = self._enqueue(lane)
+        try:
+            while (delay := self._try_acquire(lane, ticket)) > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            self._dequeue(lane, ticket)
+            raise
+        self._record(lane, time.monotonic() - started)
+
+    def retry_delay(self, response: httpx.Response, attempt: int) -> float:
+        """
+        How long to wait before retrying a response, or None to give up.
+        Throttled responses also pause the bucket for every lane.
+        """
+        if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+            return None
+        delay = parse_retry_after(response.headers)
+        if delay is None:
+            delay = self.backoff(attempt)
+        with self.lock:
+            self.retries += 1
+            if response.status_code == 429:
+                self.throttled += 1
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        return delay
+
+    def error_retry_delay(self, error: httpx.TransportError, attempt: int) -> float:
+        """
+        How long to wait before retrying a request that failed without a
+        response (connection error, timeout), or None to give up.
+        """
+        if attempt >= self.max_retries:
+            return None
+        with self.lock:
+            self.retries += 1
+            self.transport_errors += 1
+        return self.backoff(attempt)
+
+    def backoff(self, attempt: int) -> float:
+        return min(self.base_delay * 2 ** attempt, self.max_delay) * random.uniform(0.5, 1.0)
+
+    def metrics(self) -> dict:
+        """
+        Queue depth and wait time per lane, plus retry counters.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            lanes = {}
+            for lane in LANES:
+                stats = self.stats[lane]
+                lanes[lane] = {
+                    "queue_depth": len(self.queues[lane]),
+                    "requests": stats["requests"],
+                    "wait_seconds_total": round(stats["wait_seconds_total"], 3),
+                    "wait_seconds_avg": round(stats["wait_seconds_total"] / stats["requests"], 3) if stats["requests"] else 0.0,
+                    "wait_seconds_max": round(stats["wait_seconds_max"], 3),
+                }
+            return {
+                "requests_per_minute": self.rate * 60,
+                "burst": self.burst,
+                "tokens_available": round(self.tokens, 2),
+                "paused_seconds": round(max(self.paused_until - now, 0.0), 3),
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "transport_errors": self.transport_errors,
+                "lanes": lanes,
+            }
+
+    def http_client(self) -> httpx.Client:
+        """
+        httpx client for the OpenAI SDK whose requests go through the governor.
+        """
+        from openai import DefaultHttpxClient
+        return DefaultHttpxClient(transport=GovernedTransport(self, httpx.HTTPTransport()))
+
+    def async_http_client(self) -> httpx.AsyncClient:
+        from openai import DefaultAsyncHttpxClient
+        return DefaultAsyncHttpxClient(transport=AsyncGovernedTransport(self, httpx.AsyncHTTPTransport()))
+
+
+class GovernedTransport(httpx.BaseTransport):
+    def __init__(self, governor: RateGovernor, transport: httpx.BaseTransport):
+        self.governor = governor
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            self.governor.acquire()
+            try:
+                response = self.transport.handle_request(request)
+            except httpx.TransportError as e:
+                delay = self.governor.error_retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                print(f"LLM request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            delay = self.governor.retry_delay(response, attempt)
+            if delay is None:
+                return response
+            response.close()
+            print(f"LLM request got {response.status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncGovernedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, governor: RateGovernor, transport: httpx.AsyncBaseTransport):
+        self.governor = governor
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        attempt = 0
+        while True:
+            await self.governor.aacquire()
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                delay = self.governor.error_retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                print(f"LLM request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            delay = self.governor.retry_delay(response, attempt)
+            if delay is None:
+                return response
+            await response.aclose()
+            print(f"LLM request got {response.status_code}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,318 @@
+"""
+Bulk ingestion of a directory (or glob) of PDFs into a collection.
+
+PDFs are parsed in a process pool, the parsed pages are indexed in batches
+through RagAPI (one batched embedding + upsert per batch), and completed
+files are recorded in a checkpoint manifest so an interrupted run resumes
+where it stopped.
+
+    python -m libs.ingest ./documents --collection reports --workers 4
+"""
+import os
+import glob
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
+
+
+def find_pdfs(sources: List[str], recursive: bool = True) -> List[str]:
+    """
+    Expand directories and glob patterns into a sorted list of PDF paths.
+
+    Args:
+        sources: Directories, glob patterns or PDF paths.
+        recursive: Walk sub-directories of the given directories.
+
+    Returns:
+        Absolute paths of the PDFs found, without duplicates.
+    """
+    paths = set()
+    for source in sources:
+        if os.path.isdir(source):
+            pattern = os.path.join(source, "**", "*") if recursive else os.path.join(source, "*")
+            candidates = glob.glob(pattern, recursive=recursive)
+        else:
+            candidates = glob.glob(source, recursive=True)
+        paths.update(
+            os.path.abspath(path) for path in candidates
+            if os.path.isfile(path) and path.lower().endswith(".pdf")
+        )
+    return sorted(paths)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_file(file_path: str, loader_type: str, vision_model: str, doc_type: str, api_key: str):
+    """
+    Process pool entry point: parse one PDF into documents.
+    """
+    from libs.rag import load_pdf_documents
+    return load_pdf_documents(file_path, loader_type, vision_model, doc_type, api_key)
+
+
+class Manifest:
+    """
+    Checkpoint of the files already ingested into a collection, keyed by
+    absolute path and content hash, with the ref_doc_ids of their nodes.
+    Written atomically before and after every batch upsert: a file is
+    "pending" until its nodes are stored, and a pending or changed file has
+    the nodes of all its recorded ref_doc_ids deleted before it is indexed
+    again. With summaries, it also records that the collection summary is
+    behind its document summaries until it is rebuilt.
+    """
+
+    def __init__(self, path: str, collection_name: str):
+        self.path = path
+        self.data = {"collection": collection_name, "files": {}}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+            if self.data.get("collection") != collection_name:
+                raise ValueError(
+                    f"Manifest {path} belongs to collection {self.data.get('collection')!r}, not {collection_name!r}"
+                )
+
+    def is_done(self, file_path: str, sha256: str) -> bool:
+        entry = self.data["files"].get(file_path)
+        return entry is not None and entry["sha256"] == sha256 and entry.get("status", "done") == "done"
+
+    def is_known(self, file_path: str) -> bool:
+        return file_path in self.data["files"]
+
+    def ref_doc_ids(self, file_path: str) -> List[str]:
+        return list(self.data["files"].get(file_path, {}).get("ref_doc_ids", []))
+
+    def mark_pending(self, file_path: str, sha256: str, ref_doc_ids: List[str]):
+        self.data["files"][file_path] = {
+            "sha256": sha256,
+            "status": "pending",
+            "ref_doc_ids": ref_doc_ids,
+        }
+
+    def mark_done(self, file_path: str, sha256: str, ref_doc_ids: List[str], chunks: int):
+        self.data["files"][file_path] = {
+            "sha256": sha256,
+            "status": "done",
+            "ref_doc_ids": ref_doc_ids,
+            "documents": len(ref_doc_ids),
+            "chunks": chunks,
+            "ingested_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    @property
+    def collection_summary_stale(self) -> bool:
+        return self.data.get("collection_summary_stale", False)
+
+    @collection_summary_stale.setter
+    def collection_summary_stale(self, stale: bool):
+        self.data["collection_summary_stale"] = stale
+
+    def save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class Progress:
+    """
+    Running files/sec and chunks/sec report.
+    """
+
+    def __init__(self, total_files: int):
+        self.total_files = total_files
+        self.files = 0
+        self.chunks = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+
+    def update(self, files: int, chunks: int):
+        self.files += files
+        self.chunks += chunks
+        self.report()
+
+    def report(self, final: bool = False):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        prefix = "Done" if final else "Progress"
+        print(
+            f"{prefix}: {self.files}/{self.total_files} files, {self.chunks} chunks, "
+            f"{self.failed} failed in {elapsed:.1f}s "
+            f"({self.files / elapsed:.2f} files/s, {self.chunks / elapsed:.1f} chunks/s)"
+        )
+
+
+async def index_batch(rag_api, batch: List[Tuple[str, str, list]], collection_name: str, doc_type: str,
+                      summarize: bool, manifest: Manifest, progress: Progress):
+    """
+    Replace the previous nodes of the files in the batch, embed and upsert
+    their documents at once, summarize each file, then checkpoint those files.
+    """
+    # Record every ref_doc_id that may end up in the store before writing to
+    # it, so a crash mid-batch is cleaned up by the next run
+    stale = []
+    for file_path, sha256, file_docs in batch:
+        previous = manifest.ref_doc_ids(file_path)
+        stale += previous
+        manifest.mark_pending(file_path, sha256, previous + [doc.doc_id for doc in file_docs])
+    manifest.save()
+
+    await rag_api.delete_documents(stale, collection_name)
+
+    docs = [doc for _, _, file_docs in batch for doc in file_docs]
+    _, nodes = await rag_api.index_documents(docs, collection_name)
+
+    chunks_per_file: Dict[str, int] = {}
+    for node in nodes:
+        ref_doc = node.ref_doc_id
+        chunks_per_file[ref_doc] = chunks_per_file.get(ref_doc, 0) + 1
+
+    for file_path, sha256, file_docs in batch:
+        if summarize:
+            # The collection summary is rebuilt once, at the end of the run
+            await rag_api.summarize_document(file_docs, collection_name, doc_type, os.path.basename(file_path))
+            manifest.collection_summary_stale = True
+        chunks = sum(chunks_per_file.get(doc.doc_id, 0) for doc in file_docs)
+        manifest.mark_done(file_path, sha256, [doc.doc_id for doc in file_docs], chunks)
+    manifest.save()
+    progress.update(len(batch), len(nodes))
+
+
+async def ingest(rag_api, sources: List[str], collection_name: str, doc_type: str = "GENERIC",
+                 loader_type: str = "pymupdf", workers: int = None, batch_pages: int = 200,
+                 manifest_path: str = None, summarize: bool = False, recursive: bool = True) -> Progress:
+    """
+    Ingest every PDF found in sources into a collection.
+
+    Args:
+        rag_api: The RagAPI used to index the documents.
+        sources: Directories, glob patterns or PDF paths.
+        collection_name: The collection to ingest into.
+        doc_type: The type of the documents.
+        loader_type: The loader used to parse the PDFs.
+        workers: Parser processes (defaults to the CPU count).
+        batch_pages: Parsed pages (documents) embedded and upserted together.
+        manifest_path: The checkpoint manifest (defaults to
+            data/ingest/<collection_name>.json).
+        summarize: Precompute the document and collection summaries.
+        recursive: Walk sub-directories of the given directories.
+
+    Returns:
+        The final progress counters.
+    """
+    manifest = Manifest(manifest_path or os.path.join("data", "ingest", f"{collection_name}.json"), collection_name)
+
+    pending = []
+    for file_path in find_pdfs(sources, recursive):
+        sha256 = file_sha256(file_path)
+        if manifest.is_done(file_path, sha256):
+            continue
+        if manifest.is_known(file_path):
+            print(f"{file_path} changed or was interrupted since it was ingested, replacing it")
+        pending.append((file_path, sha256))
+
+    progress = Progress(len(pending))
+    print(f"{len(pending)} files to ingest into {collection_name}, {len(manifest.data['files'])} already in the manifest")
+    if pending:
+        await ingest_files(rag_api, pending, collection_name, doc_type, loader_type, workers, batch_pages,
+                           summarize, manifest, progress)
+        # Deferred metadata enrichment runs in the background, let it finish
+        await rag_api.wait_for_background_tasks()
+
+    # Also catches up on a previous run that stopped before this step
+    if summarize and manifest.collection_summary_stale:
+        await rag_api.summarize_collection(collection_name)
+        manifest.collection_summary_stale = False
+        manifest.save()
+
+    progress.report(final=True)
+    return progress
+
+
+async def ingest_files(rag_api, pending: List[Tuple[str, str]], collection_name: str, doc_type: str,
+                       loader_type: str, workers: int, batch_pages: int, summarize: bool,
+                       manifest: Manifest, progress: Progress):
+    """
+    Parse the pending (file_path, sha256) files in a process pool and index
+    them in batches of about `batch_pages` documents.
+    """
+    workers = workers or os.cpu_count() or 1
+    loop = asyncio.get_running_loop()
+    batch, batch_size = [], 0
+    # Spawn so the parsers don't inherit the parent's threads and open clients
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Keep a bounded number of parsed files in flight so memory stays flat
+        window = workers * 2
+        queue = list(reversed(pending))
+        in_flight = {}
+
+        def submit():
+            while queue and len(in_flight) < window:
+                file_path, sha256 = queue.pop()
+                future = loop.run_in_executor(
+                    pool, parse_file, file_path, loader_type, rag_api.vision_model, doc_type, rag_api.openai_api_key
+                )
+                in_flight[future] = (file_path, sha256)
+
+        submit()
+        while in_flight:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                file_path, sha256 = in_flight.pop(future)
+                try:
+                    docs = future.result()
+                except Exception as e:
+                    print(f"Failed to parse {file_path}: {e}")
+                    progress.failed += 1
+                    continue
+                batch.append((file_path, sha256, docs))
+                batch_size += len(docs)
+            submit()
+
+            if batch_size >= batch_pages or (not in_flight and batch):
+                await index_batch(rag_api, batch, collection_name, doc_type, summarize, manifest, progress)
+                batch, batch_size = [], 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk ingest a directory of PDFs into a collection")
+    parser.add_argument("sources", nargs="+", help="Directories, glob patterns or PDF files")
+    parser.add_argument("--collection", required=True, help="Collection to ingest into")
+    parser.add_argument("--doc-type", default="GENERIC", help="Document type stored in the metadata")
+    parser.add_argument("--loader", default="pymupdf", help="Loader used to parse the PDFs (pymupdf or smart)")
+    parser.add_argument("--workers", type=int, default=None, help="Parser processes (default: CPU count)")
+    parser.add_argument("--batch-pages", type=int, default=200, help="Pages embedded and upserted per batch")
+    parser.add_argument("--embed-batch-size", type=int, default=100, help="Texts per embedding request")
+    parser.add_argument("--manifest", default=None, help="Checkpoint manifest (default: data/ingest/<collection>.json)")
+    parser.add_argument("--summarize", action="store_true", help="Precompute document and collection summaries")
+    parser.add_argument("--no-recursive", action="store_true", help="Don't walk sub-directories")
+    args = parser.parse_args()
+
+    # Same configuration as the API server
+    from main import build_rag_api
+    rag_api = build_rag_api()
+    rag_api.llm_embedding.embed_batch_size = args.embed_batch_size
+
+    progress = asyncio.run(ingest(
+        rag_api, args.sources, args.collection,
+        doc_type=args.doc_type, loader_type=args.loader, workers=args.workers,
+        batch_pages=args.batch_pages, manifest_path=args.manifest,
+        summarize=args.summarize, recursive=not args.no_recursive,
+    ))
+    if progress.failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
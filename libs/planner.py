@@ -0,0 +1,119 @@
+"""
+Response planning for `response_mode=auto`.
+
+Retrieval over-fetches candidates, `select_nodes` narrows them with score
+cut-offs, and `plan_synthesis` picks the cheapest response mode whose
+estimated LLM calls and latency fit the collection's target, trimming the
+lowest-scoring nodes when nothing else does.
+"""
+import contextvars
+from contextlib import contextmanager
+from typing import List, Optional
+
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import LLMPredictStartEvent
+from llama_index.core.schema import NodeWithScore
+
+AUTO_RESPONSE_MODE = "auto"
+
+# The counters of the count_llm_calls blocks the current context is in
+llm_calls = contextvars.ContextVar("llm_calls", default=())
+
+
+class LLMCallCounter(BaseEventHandler):
+    """
+    Counts the LLM predictions made in the current context, see count_llm_calls.
+    """
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LLMCallCounter"
+
+    def handle(self, event, **kwargs):
+        if isinstance(event, LLMPredictStartEvent):
+            for counter in llm_calls.get():
+                counter["calls"] += 1
+
+
+get_dispatcher().add_event_handler(LLMCallCounter())
+
+
+@contextmanager
+def count_llm_calls():
+    """
+    Count the LLM calls (synthesis, refine and summary steps) made inside the
+    block by this request, including async tasks it spawns. Blocks nest: a
+    call is counted by every enclosing block.
+    """
+    counter = {"calls": 0}
+    token = llm_calls.set(llm_calls.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        llm_calls.reset(token)
+
+
+def select_nodes(nodes: List[NodeWithScore], min_k: int, relative_cutoff: float,
+                 score_cutoff: float = 0.0) -> List[NodeWithScore]:
+    """
+    Narrow retrieved candidates: keep the nodes scoring at least
+    `score_cutoff` and at least `relative_cutoff` times the best score, and
+    never fewer than `min_k`.
+    """
+    nodes = sorted(nodes, key=lambda n: n.score or 0.0, reverse=True)
+    if not nodes:
+        return nodes
+    best = nodes[0].score or 0.0
+    if best <= 0:
+        return nodes[:min_k]
+    kept = [
+        node for node in nodes
+        if (node.score or 0.0) >= score_cutoff and (node.score or 0.0) >= best * relative_cutoff
+    ]
+    return kept if len(kept) >= min_k else nodes[:min_k]
+
+
+def plan_synthesis(pack_counts: List[int], call_latency_ms: float,
+                   max_llm_calls: Optional[int] = None, max_latency_ms: Optional[float] = None) -> dict:
+    """
+    Choose the response mode and how many of the (score-sorted) nodes to use.
+
+    Args:
+        pack_counts: pack_counts[i] is the number of prompts the first i + 1
+            nodes fill once packed into the context window.
+        call_latency_ms: Expected latency of one LLM call.
+        max_llm_calls: Cost target, the LLM calls allowed per query.
+        max_latency_ms: Latency target for the synthesis.
+
+    Returns:
+        {"response_mode", "top_k", "estimated_llm_calls", "estimated_latency_ms"}
+    """
+    def plan(response_mode, top_k, calls, rounds):
+        return {
+            "response_mode": response_mode,
+            "top_k": top_k,
+            "estimated_llm_calls": calls,
+            "estimated_latency_ms": round(rounds * call_latency_ms),
+        }
+
+    def within(calls, rounds):
+        return ((max_llm_calls is None or calls <= max_llm_calls)
+                and (max_latency_ms is None or rounds * call_latency_ms <= max_latency_ms))
+
+    if not pack_counts:
+        return plan("compact", 0, 1, 1)
+    packs = pack_counts[-1]
+    # Everything fits one prompt: a single call, nothing is cheaper
+    if packs == 1 or within(packs, packs):
+        # compact refines sequentially over the packs
+        return plan("compact", len(pack_counts), packs, packs)
+    # tree_summarize answers the packs in parallel, then merges: one more call, two rounds
+    if within(packs + 1, 2):
+        return plan("tree_summarize", len(pack_counts), packs + 1, 2)
+    # Over budget either way: drop the lowest-scoring nodes until it fits
+    for top_k in range(len(pack_counts) - 1, 0, -1):
+        calls = pack_counts[top_k - 1]
+        if within(calls, calls):
+            return plan("compact", top_k, calls, calls)
+    return plan("compact", 1, pack_counts[0], pack_counts[0])
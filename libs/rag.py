@@ -1,4 +1,7 @@
 import os
+import shutil
+import asyncio
+import hashlib
 from fastapi import UploadFile
 from tempfile import gettempdir
 
@@ -6,28 +9,80 @@ from db.chroma import ChromaDBClient
 from llama_index.core.schema import Document as LlamaDocument
 from llama_index.core import VectorStoreIndex, StorageContext
 from llama_index.core.prompts import PromptTemplate
-from llama_index.vector_stores.chroma import ChromaVectorStore
 from llama_index.core.vector_stores import ExactMatchFilter, MetadataFilters
-from llama_index.core.extractors import (
-    TitleExtractor,
-    QuestionsAnsweredExtractor,
-)
+from llama_index.core.schema import QueryBundle, MetadataMode, NodeWithScore, TextNode
+from llama_index.core.response_synthesizers import get_response_synthesizer
 
 from pprint import pprint
 from llama_index.core.text_splitter import SentenceSplitter
 from llama_index.core import VectorStoreIndex, download_loader, StorageContext
 from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core.ingestion import IngestionPipeline
 
 from db.chroma import ChromaDBClient
-from smart_llm_loader import SmartLLMLoader
 
 from fastapi import HTTPException
 
-from libs.utils import transform_metadata, get_llm, sanitize_metadata, get_embed_model
-from libs.data import response_mode_dict
+from libs.utils import transform_metadata, get_llm, sanitize_metadata, get_embed_model, is_overview_question
+from libs.governor import RateGovernor, use_lane, INGESTION_LANE
+from libs.planner import AUTO_RESPONSE_MODE, count_llm_calls, select_nodes, plan_synthesis
+from libs.data import response_mode_dict, document_summary_query, collection_summary_query, SUMMARY_COLLECTION_SUFFIX
 from anyio import to_thread
-from typing import Tuple
+from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import fnmatch
+import re
+import json
+import time
+import fcntl
+import threading
+
+
+def convert_langchain_to_llama_docs(lc_docs, doc_type: str):
+    return [
+        LlamaDocument(
+            text=doc.page_content, 
+            metadata=sanitize_metadata(doc.metadata, doc_type))
+        for doc in lc_docs
+    ]
+
+
+def load_pdf_documents(file_path: str, loader_type: str = "pymupdf", vision_model: str = None,
+                       doc_type: str = "GENERIC", api_key: str = None) -> List[LlamaDocument]:
+    """
+    Parse a PDF into LlamaIndex documents with the chosen loader.
+
+    Module level and free of RagAPI state so it can run in a process pool.
+
+    Args:
+        file_path: The path to the PDF file.
+        loader_type: "smart" for the vision loader, anything else for PyMuPDF.
+        vision_model: The vision model used by the smart loader.
+        doc_type: The type of the document, added to every document's metadata.
+        api_key: The API key used by the smart loader.
+
+    Returns:
+        The parsed documents.
+    """
+    # Choose loader based on loader_type query parameter
+    if loader_type.lower() == "smart":
+        # Vision loader pulls in litellm and friends, only load it when asked for
+        from smart_llm_loader import SmartLLMLoader
+        loader = SmartLLMLoader(
+            file_path=file_path,
+            chunk_strategy="contextual",
+            model=vision_model,
+            api_key = api_key
+        )
+        return convert_langchain_to_llama_docs(loader.load_and_split(), doc_type)
+
+    PyMuPDFReader = download_loader("PyMuPDFReader")
+    docs = PyMuPDFReader().load_data(file_path)
+    
+    # Add doc_type to metadata
+    for doc in docs:
+        doc.metadata["doc_type"] = doc_type
+    return docs
 
 
 class RagAPI:
@@ -42,26 +97,69 @@ class RagAPI:
         self.use_metadata_pipeline = use_metadata_pipeline
         
         print("USE_METADATA? : ", self.use_metadata_pipeline)
+        
+        # Shared rate limit, priority lanes and retries for every outbound LLM/embedding request
+        self.governor = RateGovernor(
+            requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "500")),
+            burst=int(os.getenv("LLM_BURST", "10")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "5"))
+        )
     
         llm_transformations_provider = os.getenv("LLM_TRANSFORMATIONS_PROVIDER", "openai")
         llm_transformations_model = os.getenv("LLM_TRANSFORMATIONS_MODEL", "gpt-4o-mini")
 
         self.llm_transformations = get_llm(provider=llm_transformations_provider, 
-                                           model_name=llm_transformations_model)
+                                           model_name=llm_transformations_model,
+                                           governor=self.governor)
 
         llm_embeddings_provider = os.getenv("LLM_EMBEDDINGS_PROVIDER", "openai")
         llm_embeddings_model = os.getenv("LLM_EMBEDDINGS_MODEL", "text-embedding-3-large")
 
-        self.llm_embedding = get_embed_model(provider=llm_embeddings_provider, llm_embeddings_model = llm_embeddings_model)
+        self.llm_embedding = get_embed_model(provider=llm_embeddings_provider, llm_embeddings_model = llm_embeddings_model,
+                                             governor=self.governor)
         
         llm_query_provider = os.getenv("LLM_QUERY_PROVIDER", "openai")
         llm_query_model = os.getenv("LLM_QUERY_MODEL", "gpt-4o-mini")
         
 
-        self.llm_query = get_llm(provider=llm_query_provider, model_name = llm_query_model)
+        self.llm_query = get_llm(provider=llm_query_provider, model_name = llm_query_model, governor=self.governor)
         
         self.llm_translate_model = os.getenv("LLM_TRANSLATE_MODEL", "gpt-4o-mini")
         
+        # response_mode=auto: over-fetch AUTO_MAX_TOP_K candidates, keep those close
+        # to the best score, then pick the cheapest mode within the collection's target
+        self.auto_max_top_k = int(os.getenv("AUTO_MAX_TOP_K", "10"))
+        self.auto_min_top_k = int(os.getenv("AUTO_MIN_TOP_K", "2"))
+        self.auto_relative_score_cutoff = float(os.getenv("AUTO_RELATIVE_SCORE_CUTOFF", "0.8"))
+        self.auto_score_cutoff = float(os.getenv("AUTO_SCORE_CUTOFF", "0"))
+        # Prior for the per-call latency estimate, refined from observed queries
+        self.llm_call_latency_ms = float(os.getenv("LLM_CALL_LATENCY_MS", "2000"))
+        # Queries run in worker threads and update the estimate concurrently
+        self.llm_latency_lock = threading.Lock()
+        self.query_targets_path = os.getenv("QUERY_TARGETS_PATH", os.path.join("data", "query_targets.json"))
+        self.query_targets_lock = threading.Lock()
+        # (file identity, targets) of the last read, so queries don't re-read the file
+        self.query_targets_cache = (None, {})
+        self.translate_client = None
+        
+        # Shared pool for concurrent retrieval across collections
+        self.fanout_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("FANOUT_WORKERS", "16")),
+            thread_name_prefix="rag-fanout"
+        )
+        
+        # Metadata pipeline: "inline" extracts before indexing, "deferred" indexes
+        # first and enriches the nodes in a background task
+        self.metadata_mode = os.getenv("METADATA_MODE", "inline")
+        self.metadata_workers = int(os.getenv("METADATA_WORKERS", "8"))
+        self.pipeline_cache_dir = os.getenv("PIPELINE_CACHE_DIR", os.path.join("data", "pipeline_cache"))
+        self.pipeline_locks = {}
+        self.snapshot_dir = os.getenv("SNAPSHOT_DIR", os.path.join("data", "snapshots"))
+        self.background_tasks = set()
+        
+        # Precompute document/collection summaries at upload time
+        self.summarize_on_ingest = os.getenv("SUMMARIZE_ON_INGEST", "0") == "1"
+        
         
     def get_text_splitter(self):
 
@@ -71,31 +169,168 @@ class RagAPI:
         return text_splitter
     
     def get_title_extractor(self):
-        title_extractor = TitleExtractor(llm=self.llm_transformations, nodes=5)
+        from llama_index.core.extractors import TitleExtractor
+        title_extractor = TitleExtractor(llm=self.llm_transformations, nodes=5, num_workers=self.metadata_workers)
         return title_extractor
     
     def get_qa_extractor(self):
-        qa_extractor = QuestionsAnsweredExtractor(llm=self.llm_transformations, questions=3)
+        from llama_index.core.extractors import QuestionsAnsweredExtractor
+        qa_extractor = QuestionsAnsweredExtractor(llm=self.llm_transformations, questions=3, num_workers=self.metadata_workers)
         return qa_extractor
 
-    def get_pipeline(self):
+    def get_pipeline(self, transformations=None, persist_dir: str = None, use_docstore: bool = False):
+        """
+        Build the ingestion pipeline with a transformation cache, loaded from
+        `persist_dir` when it exists. With `use_docstore` the pipeline also
+        remembers the hashes of the documents it has seen and skips unchanged
+        ones.
+        """
+        from llama_index.core.ingestion import IngestionPipeline, IngestionCache, DocstoreStrategy
+        from llama_index.core.storage.docstore import SimpleDocumentStore
         
+        if transformations is None:
+            transformations = [
+                self.get_text_splitter(),
+                self.get_title_extractor(),
+                self.get_qa_extractor()
+            ]
         pipeline = IngestionPipeline(
-                transformations=[
-                    self.get_text_splitter(),
-                    self.get_title_extractor(),
-                    self.get_qa_extractor()
-                ]
+                transformations=transformations,
+                cache=IngestionCache(),
+                docstore=SimpleDocumentStore() if use_docstore else None,
+                docstore_strategy=DocstoreStrategy.DUPLICATES_ONLY,
             )
+        if persist_dir and os.path.exists(persist_dir):
+            pipeline.load(persist_dir)
         return pipeline
+
+    def get_pipeline_dir(self, collection_name: str) -> str:
+        return os.path.join(self.pipeline_cache_dir, collection_name)
+
+    def get_pipeline_lock(self, collection_name: str) -> asyncio.Lock:
+        # One writer per collection for the persisted docstore and cache
+        return self.pipeline_locks.setdefault(collection_name, asyncio.Lock())
+
+    async def run_metadata_pipeline(self, docs, collection_name: str, storage_context: StorageContext):
+        """
+        Split (and, inline, extract metadata from) the documents, skipping
+        documents already ingested into this collection, and index the nodes.
+
+        Returns:
+            The index and the nodes that were indexed.
+        """
+        persist_dir = os.path.join(self.get_pipeline_dir(collection_name), "documents")
+        deferred = self.metadata_mode == "deferred"
+        transformations = [self.get_text_splitter()] if deferred else None
+
+        async with self.get_pipeline_lock(collection_name):
+            pipeline = self.get_pipeline(transformations, persist_dir=persist_dir, use_docstore=True)
+            nodes = await pipeline.arun(
+                documents=docs,
+                in_place=True,
+                show_progress=True,
+                store_doc_text=False,
+            )
+            print(f"Metadata pipeline produced {len(nodes)} nodes for collection '{collection_name}'")
+
+            index = await self.add_nodes(storage_context.vector_store, nodes)
+            # Persist only once the nodes are indexed, so a failed upload is retried in full
+            pipeline.persist(persist_dir)
+
+        if deferred and nodes:
+            self.schedule_metadata_enrichment(storage_context.vector_store, collection_name, nodes)
+        return index, nodes
+
+    async def delete_documents(self, ref_doc_ids: List[str], collection_name: str):
+        """
+        Delete the nodes of documents from a collection and forget their
+        hashes in the metadata pipeline docstore, so the same content is
+        indexed again when it is re-uploaded instead of skipped as a duplicate.
+        """
+        if not ref_doc_ids:
+            return
+        vector_store = self.chroma_client.get_vector_store(collection_name)
+
+        def delete_nodes():
+            for ref_doc_id in ref_doc_ids:
+                vector_store.delete(ref_doc_id)
+
+        await to_thread.run_sync(delete_nodes)
+
+        persist_dir = os.path.join(self.get_pipeline_dir(collection_name), "documents")
+        async with self.get_pipeline_lock(collection_name):
+            if not os.path.exists(persist_dir):
+                return
+            pipeline = self.get_pipeline([], persist_dir=persist_dir, use_docstore=True)
+            for ref_doc_id in ref_doc_ids:
+                pipeline.docstore.delete_document(ref_doc_id, raise_error=False)
+            pipeline.persist(persist_dir)
+
+    def schedule_metadata_enrichment(self, vector_store, collection_name: str, nodes):
+        task = asyncio.create_task(self.enrich_metadata(vector_store, collection_name, nodes))
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+
+    async def enrich_metadata(self, vector_store, collection_name: str, nodes):
+        """
+        Background pass for METADATA_MODE=deferred: run the title and question
+        extractors over nodes that are already queryable, re-embed them with
+        the new metadata and replace them in the vector store.
+        """
+        persist_dir = os.path.join(self.get_pipeline_dir(collection_name), "enrichment")
+        try:
+            pipeline = self.get_pipeline(
+                [self.get_title_extractor(), self.get_qa_extractor()], persist_dir=persist_dir
+            )
+            enriched = await pipeline.arun(nodes=nodes, in_place=False, show_progress=False)
+
+            await self.embed_nodes(enriched)
+
+            def replace_nodes():
+                vector_store.delete_nodes([node.node_id for node in nodes])
+                vector_store.add(enriched)
+
+            await to_thread.run_sync(replace_nodes)
+            async with self.get_pipeline_lock(collection_name):
+                pipeline.persist(persist_dir)
+            print(f"Metadata enrichment done for {len(enriched)} nodes in collection '{collection_name}'")
+        except Exception as e:
+            print(f"Metadata enrichment failed for collection '{collection_name}': {str(e)}")
+
+    async def embed_nodes(self, nodes, show_progress: bool = False):
+        """
+        Embed nodes in place through the async client, so waiting on the rate
+        governor or on retries never blocks the event loop.
+        """
+        if not nodes:
+            return
+        embeddings = await self.llm_embedding.aget_text_embedding_batch(
+            [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes], show_progress=show_progress
+        )
+        for node, embedding in zip(nodes, embeddings):
+            node.embedding = embedding
+
+    async def add_nodes(self, vector_store, nodes) -> VectorStoreIndex:
+        """
+        Embed nodes and upsert them into a vector store, off the event loop.
+
+        Returns:
+            The index over the vector store.
+        """
+        await self.embed_nodes(nodes, show_progress=True)
+        if nodes:
+            await to_thread.run_sync(vector_store.add, nodes)
+        return VectorStoreIndex.from_vector_store(vector_store, embed_model=self.llm_embedding)
+
+    async def wait_for_background_tasks(self):
+        """
+        Wait for the pending deferred metadata enrichment tasks.
+        """
+        while self.background_tasks:
+            await asyncio.gather(*list(self.background_tasks))
     
     def convert_langchain_to_llama_docs(self, lc_docs, doc_type: str):
-        return [
-            LlamaDocument(
-                text=doc.page_content, 
-                metadata=sanitize_metadata(doc.metadata, doc_type))
-            for doc in lc_docs
-        ]
+        return convert_langchain_to_llama_docs(lc_docs, doc_type)
 
 
     async def process_pdf(
@@ -106,7 +341,8 @@ class RagAPI:
         loader_type: str = "pymupdf", 
         vision_model: str = "gemini/gemini-1.5-flash",
         doc_type: str = "GENERIC",
-        api_key: str = None
+        api_key: str = None,
+        summarize: bool = None
     ) -> Tuple[VectorStoreIndex, str]:
         """
         Process a PDF file and return a VectorStoreIndex.
@@ -119,68 +355,185 @@ class RagAPI:
             vision_model: The vision model to use to load the document.
             doc_type: The type of the document.
             api_key: The API key to use to load the document.
+            summarize: Precompute the document and collection summaries
+                (defaults to SUMMARIZE_ON_INGEST).
 
         Returns:
             A VectorStoreIndex.
         """
-        # Get (or create) a collection in ChromaDB
-        collection = chroma_client.get_or_create_collection(collection_name)
-        vector_store = ChromaVectorStore(chroma_collection=collection)
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
+        if summarize is None:
+            summarize = self.summarize_on_ingest
+        # Ingestion yields to interactive queries for the LLM rate limit,
+        # background enrichment tasks started here inherit the lane
+        with use_lane(INGESTION_LANE):
+            docs = await self.load_documents(file_path, loader_type, vision_model, doc_type, api_key)
+            documents_size = len(docs)
+                
+            pprint(docs[0].metadata)
+            index, _ = await self.index_documents(docs, collection_name, chroma_client)
+
+            if summarize:
+                await self.build_summaries(docs, collection_name, doc_type, os.path.basename(file_path))
+        return index, documents_size
 
-        documents_size = 0
-        # Choose loader based on loader_type query parameter
+    async def load_documents(self, file_path: str, loader_type: str = "pymupdf", vision_model: str = None,
+                             doc_type: str = "GENERIC", api_key: str = None) -> List[LlamaDocument]:
+        """
+        Parse a PDF into documents off the event loop.
+        """
         if loader_type.lower() == "smart":
-            loader = SmartLLMLoader(
-                file_path=file_path,
-                chunk_strategy="contextual",
-                model=vision_model,
-                api_key = api_key
-            )
-            # Run loader.load_and_split() in a separate thread to avoid nested event loops
-            docs = await to_thread.run_sync(loader.load_and_split)
-            docs = self.convert_langchain_to_llama_docs(docs, doc_type)
-            documents_size = len(docs)
-        else:
-            PyMuPDFReader = download_loader("PyMuPDFReader")
-            docs = PyMuPDFReader().load_data(file_path)
-            
-            # Add doc_type to metadata
-            for doc in docs:
-                doc.metadata["doc_type"] = doc_type
-            
-            documents_size = len(docs)
-            
-        pprint(docs[0].metadata)
-        if self.use_metadata_pipeline:
-            pipeline = self.get_pipeline()
-            nodes = pipeline.run(
-                documents=docs,
-                in_place=True,
-                show_progress=True,
-            )
-            
-            index = VectorStoreIndex(
-                nodes,
-                storage_context=storage_context, 
-                embed_model=self.llm_embedding
-            )
+            # The vision loader calls the model through litellm, outside the
+            # governed clients: charge the governor one request per page up front
+            import pymupdf
+            with pymupdf.open(file_path) as pdf:
+                pages = pdf.page_count
+            for _ in range(pages):
+                await self.governor.aacquire()
+        return await to_thread.run_sync(
+            load_pdf_documents, file_path, loader_type, vision_model or self.vision_model,
+            doc_type, api_key or self.openai_api_key
+        )
+
+    async def index_documents(self, docs: List[LlamaDocument], collection_name: str, chroma_client: ChromaDBClient = None):
+        """
+        Split, embed and upsert documents into a collection, through the
+        metadata pipeline when it is enabled.
+
+        Returns:
+            The index and the nodes that were indexed.
+        """
+        # Get (or create) the collection in the configured vector store backend
+        vector_store = (chroma_client or self.chroma_client).get_vector_store(collection_name)
+        storage_context = StorageContext.from_defaults(vector_store=vector_store)
 
-            return index, documents_size
+        if self.use_metadata_pipeline:
+            return await self.run_metadata_pipeline(docs, collection_name, storage_context)
 
         # Build (or update) the index using the parsed documents
-        index = VectorStoreIndex.from_documents(
-            docs, 
-            storage_context=storage_context,
-            embed_model=self.llm_embedding,
-            transformations=[
-                SentenceSplitter(chunk_size=1000, chunk_overlap=200)
-            ],
-            show_progress=True
+        nodes = SentenceSplitter(chunk_size=1000, chunk_overlap=200).get_nodes_from_documents(docs, show_progress=True)
+        index = await self.add_nodes(vector_store, nodes)
+        return index, nodes
+
+    def get_summary_collection_name(self, collection_name: str) -> str:
+        return f"{collection_name}{SUMMARY_COLLECTION_SUFFIX}"
+
+    def get_summaries(self, collection_name: str) -> dict:
+        """
+        Read the precomputed summaries of a collection.
+
+        Returns:
+            {"collection": the collection summary or None,
+             "documents": [{"file_name", "doc_type", "text"}, ...]}
+        """
+        summaries = {"collection": None, "documents": []}
+        summary_collection_name = self.get_summary_collection_name(collection_name)
+        if summary_collection_name not in self.chroma_client.list_collections():
+            return summaries
+        records = self.chroma_client.get_or_create_collection(summary_collection_name).get(
+            include=["documents", "metadatas"]
         )
-        return index, documents_size
+        for text, metadata in zip(records["documents"], records["metadatas"]):
+            if metadata.get("summary_level") == "collection":
+                summaries["collection"] = text
+            else:
+                summaries["documents"].append({
+                    "file_name": metadata.get("file_name"),
+                    "doc_type": metadata.get("doc_type"),
+                    "text": text,
+                })
+        return summaries
+
+    async def build_summaries(self, docs, collection_name: str, doc_type: str, file_name: str):
+        """
+        Summarize a document, then re-summarize the collection from all its
+        document summaries. Bulk ingestion summarizes the collection once per
+        run instead, see summarize_document and summarize_collection.
+        """
+        await self.summarize_document(docs, collection_name, doc_type, file_name)
+        await self.summarize_collection(collection_name)
+
+    def get_summary_synthesizer(self):
+        return get_response_synthesizer(
+            llm=self.llm_transformations, response_mode="tree_summarize", use_async=True
+        )
+
+    async def summarize_document(self, docs, collection_name: str, doc_type: str, file_name: str):
+        """
+        Summarize a document bottom-up (tree_summarize over its chunks) and
+        store it in the collection's companion summary collection, replacing
+        the previous summary of the same file.
+        """
+        chunks = [NodeWithScore(node=node) for node in self.get_text_splitter().get_nodes_from_documents(docs)]
+        document_summary = str(await self.get_summary_synthesizer().asynthesize(document_summary_query, nodes=chunks))
+        await self.store_summary(collection_name, TextNode(
+            id_="summary-" + hashlib.sha1(file_name.encode("utf-8")).hexdigest(),
+            text=document_summary,
+            metadata={"summary_level": "document", "file_name": file_name, "doc_type": doc_type},
+        ))
+        print(f"Stored the summary of '{file_name}' for collection '{collection_name}'")
+
+    async def summarize_collection(self, collection_name: str):
+        """
+        Summarize the collection from all its stored document summaries and
+        store it in the companion summary collection.
+        """
+        document_summaries = (await to_thread.run_sync(self.get_summaries, collection_name))["documents"]
+        if not document_summaries:
+            return
+        if len(document_summaries) == 1:
+            collection_summary = document_summaries[0]["text"]
+        else:
+            collection_summary = str(await self.get_summary_synthesizer().asynthesize(
+                collection_summary_query,
+                nodes=[
+                    NodeWithScore(node=TextNode(text=f"{d['file_name']}: {d['text']}"))
+                    for d in document_summaries
+                ],
+            ))
+        await self.store_summary(collection_name, TextNode(
+            id_="summary-collection",
+            text=collection_summary,
+            metadata={"summary_level": "collection", "collection_name": collection_name},
+        ))
+        print(f"Stored the summary of collection '{collection_name}' from {len(document_summaries)} documents")
+
+    async def store_summary(self, collection_name: str, node: TextNode):
+        node.embedding = await self.llm_embedding.aget_text_embedding(node.text)
+
+        def store():
+            vector_store = self.chroma_client.get_vector_store(self.get_summary_collection_name(collection_name))
+            vector_store.delete_nodes([node.node_id])
+            vector_store.add([node])
+
+        await to_thread.run_sync(store)
+
+    def answer_from_summary(self, q: str, doc_type: str, collection_name: str, qa_template: PromptTemplate):
+        """
+        Answer an overview question from the precomputed summaries with a
+        single LLM call. Returns None when there is no summary to use.
+        """
+        summaries = self.get_summaries(collection_name)
+        if doc_type:
+            texts = [d["text"] for d in summaries["documents"] if d["doc_type"] == doc_type]
+            metadata = [d for d in summaries["documents"] if d["doc_type"] == doc_type]
+        elif summaries["collection"]:
+            texts = [summaries["collection"]]
+            metadata = summaries["documents"]
+        else:
+            return None
+        if not texts:
+            return None
+
+        synthesizer = get_response_synthesizer(
+            llm=self.llm_query, text_qa_template=qa_template, response_mode="simple_summarize"
+        )
+        response = synthesizer.synthesize(q, nodes=[NodeWithScore(node=TextNode(text=text)) for text in texts])
+        return response, [
+            {"doc_id": None, "file_name": d["file_name"], "doc_type": d["doc_type"], "summary_level": "document"}
+            for d in metadata
+        ]
     
-    async def upload_document(self, file: UploadFile, collection_name: str, doc_type: str, loader: str):
+    async def upload_document(self, file: UploadFile, collection_name: str, doc_type: str, loader: str, summarize: bool = None):
         """
         Upload a document to the RAG API.
 
@@ -189,6 +542,7 @@ class RagAPI:
             collection_name: The name of the collection to upload the document to.
             doc_type: The type of the document.
             loader: The loader to use to load the document.
+            summarize: Precompute the document and collection summaries.
 
         Returns:
             A message indicating that the file has been uploaded and processed.
@@ -222,7 +576,8 @@ class RagAPI:
                 _, documents_size = await self.process_pdf(
                     self.chroma_client, file_path, collection_name,
                     loader_type=loader, vision_model=self.vision_model,
-                    doc_type=doc_type, api_key=self.openai_api_key
+                    doc_type=doc_type, api_key=self.openai_api_key,
+                    summarize=summarize
                 )
             
                 print("File processed successfully, at file_path: ", file_path)
@@ -235,14 +590,15 @@ class RagAPI:
             return {
                 "message": f"File uploaded and processed into collection '{collection_name}' using loader '{loader}'.",
                 "status": "success",
-                "documents_size": documents_size
+                "documents_size": documents_size,
+                "metadata_mode": self.metadata_mode if self.use_metadata_pipeline else "disabled"
             }
             
         except Exception as e:
             print(f"Error processing document: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
 
-    def query_documents(self, q: str, doc_type: str, collection_name: str, response_mode: str):
+    def query_documents(self, q: str, doc_type: str, collection_name: str, response_mode: str, top_k: int = None):
         """
         Query the RAG API for a question.
 
@@ -250,67 +606,314 @@ class RagAPI:
             q: The question to query the RAG API with.
             doc_type: The type of the document to query the RAG API with.
             collection_name: The name of the collection to query the RAG API with.
-            response_mode: The response mode to use for the query.
+            response_mode: The response mode to use for the query, or "auto".
+            top_k: The nodes retrieved (default 3; with "auto", the candidates
+                considered, default AUTO_MAX_TOP_K).
 
         Returns:
             A message indicating that the query has been processed.
         """
-        coll = self.chroma_client.get_or_create_collection(collection_name)
-        vector_store = ChromaVectorStore(chroma_collection=coll)
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
+        index = self.get_index(collection_name)
         
-        # Make sure to use the same embedding model that was used for indexing
-        index = VectorStoreIndex(
-            [], 
-            vector_store=vector_store, 
-            storage_context=storage_context,
-            embed_model=self.llm_embedding
-        )
+        # Build the prompt per request; self.qa_template is shared by every
+        # concurrent query and must never be reassigned.
+        qa_template = self.qa_template.partial_format(question=q)
         
-        self.qa_template = self.qa_template.partial_format(question=q)
+        # Overview questions ("What is the document about?") are answered from
+        # the summaries precomputed at ingest time, when there are any
+        summary_answer = None
+        with count_llm_calls() as llm_calls:
+            if is_overview_question(q):
+                try:
+                    summary_answer = self.answer_from_summary(q, doc_type, collection_name, qa_template)
+                except Exception as e:
+                    print(f"Answering from summary failed, falling back to retrieval: {str(e)}")
+
+            if summary_answer is not None:
+                response, metadata = summary_answer
+                answered_from = "summary"
+                response_mode = "simple_summarize"
+                print(f"Response from summary: {response}")
+            else:
+                answered_from = "retrieval"
+                try:
+                    retriever = index.as_retriever(
+                        similarity_top_k=top_k or (self.auto_max_top_k if response_mode == AUTO_RESPONSE_MODE else 3),
+                        filters=self.get_filters(doc_type)
+                    )
+                    response, response_mode = self.synthesize(
+                        q, retriever.retrieve(q), qa_template, response_mode, self.get_query_target(collection_name)
+                    )
+                    print(f"Response from query: {response}")
+                
+                    if hasattr(response, '__dict__'):
+                        print("METADATA:")
+                        import pprint
+                        pprint.pprint(response.__dict__)
+                    
+                    if response.metadata:
+                        metadata = transform_metadata(response.metadata, doc_type=None)
+                    else:
+                        metadata = []
+                except Exception as e:
+                    print(f"Query failed: {str(e)}")
+                    raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
         
-        print(self.qa_template)
-        if doc_type:
-            filters = MetadataFilters(filters=[
-                ExactMatchFilter(key="doc_type", value=doc_type)
-            ])
-            query_engine = index.as_query_engine(
-                llm=self.llm_query,
-                text_qa_template=self.qa_template,
-                response_mode=response_mode,
-                similarity_top_k=3,
-                verbose=True,
-                filters=filters
-            )
-        else:
-            query_engine = index.as_query_engine(
-                llm=self.llm_query,
-                text_qa_template=self.qa_template,
-                response_mode=response_mode,
-                similarity_top_k=3,
-                verbose=True
-            )
+        if response.response:
+            response.response = self.translate_text(response.response, target_language="Spanish").get("translated")
+        
+        return {
+            "question": q, "answer": response.response, "metadata": metadata, "answered_from": answered_from,
+            "response_mode": response_mode, "top_k": len(response.source_nodes), "llm_calls": llm_calls["calls"]
+        }
+
+    def query_collections(self, q: str, doc_type: str, collection_names: List[str], collection_pattern: str, response_mode: str, top_k: int = None):
+        """
+        Query several collections at once: retrieve from all of them
+        concurrently, keep the best `top_k` nodes across collections by score
+        and run a single synthesis over the merged context.
+
+        Args:
+            q: The question to query the RAG API with.
+            doc_type: The type of the document to query the RAG API with.
+            collection_names: Explicit collection names to query.
+            collection_pattern: A glob (or prefix) matched against the existing collections.
+            response_mode: The response mode to use for the query, or "auto".
+            top_k: The number of nodes kept after merging (default 3; with
+                "auto", the candidates considered, default AUTO_MAX_TOP_K).
+
+        Returns:
+            The answer, the metadata of the merged nodes and the collections queried.
+        """
+        collection_names = self.resolve_collections(collection_names, collection_pattern)
+        filters = self.get_filters(doc_type)
+        top_k = top_k or (self.auto_max_top_k if response_mode == AUTO_RESPONSE_MODE else 3)
+
         try:
-            response = query_engine.query(q)
-            print(f"Response from query: {response}")
-            
-            if hasattr(response, '__dict__'):
-                print("METADATA:")
-                import pprint
-                pprint.pprint(response.__dict__)
-                
+            # Embed the question once and share it across collections
+            query_bundle = QueryBundle(query_str=q, embedding=self.llm_embedding.get_query_embedding(q))
+
+            def retrieve(collection_name):
+                retriever = self.get_index(collection_name).as_retriever(
+                    similarity_top_k=top_k, filters=filters
+                )
+                nodes = retriever.retrieve(query_bundle)
+                for node in nodes:
+                    node.node.metadata["collection_name"] = collection_name
+                return nodes
+
+            # copy_context keeps per-request context vars in the worker threads
+            futures = [
+                self.fanout_executor.submit(contextvars.copy_context().run, retrieve, name)
+                for name in collection_names
+            ]
+            nodes = [node for future in futures for node in future.result()]
+            nodes = sorted(nodes, key=lambda n: n.score or 0.0, reverse=True)[:top_k]
+
+            qa_template = self.qa_template.partial_format(question=q)
+            with count_llm_calls() as llm_calls:
+                response, response_mode = self.synthesize(
+                    q, nodes, qa_template, response_mode, self.get_query_target(*collection_names)
+                )
+            print(f"Response from query over {collection_names}: {response}")
+
             if response.metadata:
                 metadata = transform_metadata(response.metadata, doc_type=None)
             else:
                 metadata = []
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"Query failed: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
-        
+
         if response.response:
             response.response = self.translate_text(response.response, target_language="Spanish").get("translated")
+
+        return {
+            "question": q, "answer": response.response, "metadata": metadata, "collections": collection_names,
+            "response_mode": response_mode, "top_k": len(response.source_nodes), "llm_calls": llm_calls["calls"]
+        }
+
+    def synthesize(self, q: str, nodes: List[NodeWithScore], qa_template: PromptTemplate, response_mode: str,
+                   target: dict):
+        """
+        Answer from retrieved nodes. Only the synthesis is timed for the
+        per-call latency estimate, retrieval (embedding and search) is not.
+
+        Args:
+            q: The question.
+            nodes: The retrieved nodes.
+            qa_template: The QA prompt for this question.
+            response_mode: The response mode, or "auto".
+            target: {"max_llm_calls", "max_latency_ms"} used by "auto".
+
+        Returns:
+            The response and the response mode used.
+        """
+        synthesizer_kwargs = {}
+        if response_mode == AUTO_RESPONSE_MODE:
+            nodes, response_mode = self.plan_auto(q, nodes, qa_template, target)
+            # The plan counts calls with the QA prompt packing, for summaries too
+            synthesizer_kwargs = {"summary_template": qa_template, "use_async": response_mode == "tree_summarize"}
+        synthesizer = get_response_synthesizer(
+            llm=self.llm_query,
+            text_qa_template=qa_template,
+            response_mode=response_mode,
+            **synthesizer_kwargs,
+        )
+        started = time.perf_counter()
+        with count_llm_calls() as llm_calls:
+            response = synthesizer.synthesize(q, nodes=nodes)
+        self.observe_llm_latency(time.perf_counter() - started, llm_calls["calls"])
+        return response, response_mode
+
+    def plan_auto(self, q: str, nodes: List[NodeWithScore], qa_template: PromptTemplate, target: dict):
+        """
+        Pick the cheapest response mode that fits the context window and the
+        target for `response_mode=auto`.
+
+        Narrows the candidates with the score cut-offs, measures how many
+        prompts they fill once packed into the context window, and lets
+        plan_synthesis choose the mode and the number of nodes.
+
+        Args:
+            q: The question.
+            nodes: The retrieved candidates.
+            qa_template: The QA prompt for this question.
+            target: {"max_llm_calls", "max_latency_ms"}, either may be None.
+
+        Returns:
+            The nodes to synthesize from and the response mode.
+        """
+        from llama_index.core.indices.prompt_helper import PromptHelper
+        from llama_index.core.prompts.prompt_utils import get_biggest_prompt
+        from llama_index.core.prompts.default_prompt_selectors import DEFAULT_REFINE_PROMPT_SEL
+
+        nodes = select_nodes(nodes, self.auto_min_top_k, self.auto_relative_score_cutoff, self.auto_score_cutoff)
+        # Pack the chunks the way the compact synthesizer will
+        prompt_helper = PromptHelper.from_llm_metadata(self.llm_query.metadata)
+        pack_prompt = get_biggest_prompt([
+            qa_template.partial_format(query_str=q), DEFAULT_REFINE_PROMPT_SEL.partial_format(query_str=q)
+        ])
+        chunks = [node.node.get_content(metadata_mode=MetadataMode.LLM) for node in nodes]
+        pack_counts = [
+            len(prompt_helper.repack(pack_prompt, chunks[:used], llm=self.llm_query))
+            for used in range(1, len(chunks) + 1)
+        ]
+        plan = plan_synthesis(
+            pack_counts, self.llm_call_latency_ms,
+            max_llm_calls=target.get("max_llm_calls"), max_latency_ms=target.get("max_latency_ms")
+        )
+        print(f"Auto response plan: {plan} over {len(nodes)} candidate nodes")
+        return nodes[:plan["top_k"]], plan["response_mode"]
+
+    def observe_llm_latency(self, elapsed: float, calls: int):
+        """
+        Fold an observed synthesis latency into the per-call estimate used by
+        the auto response mode.
+        """
+        if calls:
+            with self.llm_latency_lock:
+                self.llm_call_latency_ms = 0.8 * self.llm_call_latency_ms + 0.2 * (elapsed * 1000 / calls)
+
+    def read_query_targets(self) -> dict:
+        """
+        The targets file, re-read only when it was replaced since the last read
+        (by this or another worker).
+        """
+        try:
+            stat = os.stat(self.query_targets_path)
+        except FileNotFoundError:
+            return {}
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached_key, targets = self.query_targets_cache
+        if key != cached_key:
+            with open(self.query_targets_path) as f:
+                targets = json.load(f)
+            self.query_targets_cache = (key, targets)
+        return targets
+
+    def get_query_target(self, *collection_names: str) -> dict:
+        """
+        The latency/cost target of a collection; for several collections the
+        strictest value of each limit.
+        """
+        targets = self.read_query_targets()
+        merged = {"max_llm_calls": None, "max_latency_ms": None}
+        for collection_name in collection_names:
+            for key, value in targets.get(collection_name, {}).items():
+                if value is not None and key in merged:
+                    merged[key] = value if merged[key] is None else min(merged[key], value)
+        return merged
+
+    def set_query_target(self, collection_name: str, max_llm_calls: int = None, max_latency_ms: int = None) -> dict:
+        """
+        Set (or, with no limits, clear) the latency/cost target used by the
+        auto response mode for a collection.
+
+        Args:
+            collection_name: The collection.
+            max_llm_calls: LLM calls allowed per query.
+            max_latency_ms: Synthesis latency allowed per query.
+
+        Returns:
+            The collection's target.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(self.query_targets_path)), exist_ok=True)
+        # The file lock serializes the read-modify-write across workers
+        with self.query_targets_lock, open(self.query_targets_path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                targets = dict(self.read_query_targets())
+                if max_llm_calls is None and max_latency_ms is None:
+                    targets.pop(collection_name, None)
+                else:
+                    targets[collection_name] = {"max_llm_calls": max_llm_calls, "max_latency_ms": max_latency_ms}
+                tmp_path = self.query_targets_path + ".tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(targets, f, indent=2)
+                os.replace(tmp_path, self.query_targets_path)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return {"collection": collection_name, **self.get_query_target(collection_name)}
+
+    def resolve_collections(self, collection_names: List[str], collection_pattern: str) -> List[str]:
+        """
+        Expand explicit names and a glob pattern into the collections to query.
+        A pattern without wildcards is treated as a prefix.
+        """
+        names = list(dict.fromkeys(collection_names or []))
+        if collection_pattern:
+            if not any(char in collection_pattern for char in "*?["):
+                collection_pattern = collection_pattern + "*"
+            names += [
+                name for name in self.chroma_client.list_collections()
+                if fnmatch.fnmatchcase(name, collection_pattern) and name not in names
+                and not name.endswith(SUMMARY_COLLECTION_SUFFIX)
+            ]
+        if not names:
+            raise HTTPException(status_code=404, detail="No collections matched the query")
+        return names
+
+    def get_index(self, collection_name: str) -> VectorStoreIndex:
+        vector_store = self.chroma_client.get_vector_store(collection_name)
+        storage_context = StorageContext.from_defaults(vector_store=vector_store)
         
-        return {"question": q, "answer": response.response, "metadata": metadata}
+        # Make sure to use the same embedding model that was used for indexing
+        return VectorStoreIndex(
+            [], 
+            vector_store=vector_store, 
+            storage_context=storage_context,
+            embed_model=self.llm_embedding
+        )
+
+    def get_filters(self, doc_type: str):
+        if not doc_type:
+            return None
+        return MetadataFilters(filters=[
+            ExactMatchFilter(key="doc_type", value=doc_type)
+        ])
 
     def get_info(self):
         """
@@ -321,6 +924,13 @@ class RagAPI:
         """
         return {"version": "1.0.0", "description": "RAG API", "supported_response_modes": response_mode_dict}
 
+    def get_metrics(self):
+        """
+        Get the outbound LLM governor metrics: queue depth and wait time per
+        lane, retries and throttled responses.
+        """
+        return {"llm_governor": self.governor.metrics()}
+
     def list_all_collections(self):
         """
         List all collections in the RAG API.
@@ -330,7 +940,10 @@ class RagAPI:
         """
         try:
             return {
-                "collections": self.chroma_client.list_collections()
+                "collections": [
+                    name for name in self.chroma_client.list_collections()
+                    if not name.endswith(SUMMARY_COLLECTION_SUFFIX)
+                ]
             }
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Failed to list collections: {str(e)}")
@@ -342,11 +955,98 @@ class RagAPI:
         """
         try:
             self.chroma_client.delete_collection(collection_name)
+            summary_collection_name = self.get_summary_collection_name(collection_name)
+            if summary_collection_name in self.chroma_client.list_collections():
+                self.chroma_client.delete_collection(summary_collection_name)
+            # The cached docstore would otherwise skip re-uploads into a new collection of the same name
+            shutil.rmtree(self.get_pipeline_dir(collection_name), ignore_errors=True)
+            if collection_name in self.read_query_targets():
+                self.set_query_target(collection_name)
             return {"message": f"Collection '{collection_name}' deleted successfully."}
         except Exception as e:
             print(f"Error deleting collection: {str(e)}")
             raise HTTPException(status_code=404, detail=f"Collection '{collection_name}' not found")
 
+    def get_snapshot_path(self, snapshot_name: str) -> str:
+        """
+        Resolve a snapshot name to a directory under SNAPSHOT_DIR.
+        """
+        if not re.fullmatch(r"[A-Za-z0-9][A-Za-z0-9._-]*", snapshot_name or ""):
+            raise HTTPException(status_code=400, detail=f"Invalid snapshot name: '{snapshot_name}'")
+        return os.path.join(self.snapshot_dir, snapshot_name)
+
+    def export_collection(self, collection_name: str, snapshot_name: str = None, path: str = None, batch_size: int = 5000) -> dict:
+        """
+        Export a collection (ids, texts, metadata and embeddings) and its
+        precomputed summaries to a columnar snapshot.
+
+        Args:
+            collection_name: The collection to export.
+            snapshot_name: The snapshot directory under SNAPSHOT_DIR (defaults to the collection name).
+            path: An explicit snapshot directory, takes precedence over snapshot_name.
+            batch_size: Rows read from the vector store per call.
+
+        Returns:
+            The snapshot manifest with its path and the number of summaries exported.
+        """
+        from libs.snapshot import export_collection
+
+        if collection_name not in self.chroma_client.list_collections():
+            raise HTTPException(status_code=404, detail=f"Collection '{collection_name}' not found")
+        path = path or self.get_snapshot_path(snapshot_name or collection_name)
+        print(f"Exporting collection {collection_name} to {path}")
+
+        # Summaries first: the collection's manifest, written last, marks the
+        # whole snapshot complete
+        manifest_path = os.path.join(path, "manifest.json")
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        summaries_path = os.path.join(path, "summaries")
+        shutil.rmtree(summaries_path, ignore_errors=True)
+        summaries = 0
+        summary_collection_name = self.get_summary_collection_name(collection_name)
+        if summary_collection_name in self.chroma_client.list_collections():
+            summary_collection = self.chroma_client.get_or_create_collection(summary_collection_name)
+            summaries = export_collection(summary_collection, summary_collection_name, summaries_path, batch_size)["count"]
+        manifest = export_collection(self.chroma_client.get_or_create_collection(collection_name), collection_name, path, batch_size)
+        return {**manifest, "path": path, "summaries": summaries}
+
+    def import_collection(self, path: str, collection_name: str = None, overwrite: bool = False, batch_size: int = 5000) -> dict:
+        """
+        Bulk-import a snapshot into a new collection, reusing the stored
+        embeddings instead of calling the embedding model.
+
+        Args:
+            path: The snapshot directory.
+            collection_name: The target collection (defaults to the exported collection name).
+            overwrite: Replace the target collection when it already holds data.
+            batch_size: Rows upserted per call.
+
+        Returns:
+            The snapshot manifest with the target collection and the number of summaries imported.
+        """
+        from libs.snapshot import import_collection, read_manifest
+
+        try:
+            manifest = read_manifest(path)
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        collection_name = collection_name or manifest["collection"]
+
+        if collection_name in self.chroma_client.list_collections():
+            if self.chroma_client.get_or_create_collection(collection_name).count() and not overwrite:
+                raise HTTPException(status_code=409, detail=f"Collection '{collection_name}' already exists and is not empty")
+            self.delete_collection(collection_name)
+        print(f"Importing snapshot {path} into collection {collection_name}")
+
+        import_collection(self.chroma_client.get_or_create_collection(collection_name), path, batch_size)
+        summaries = 0
+        summaries_path = os.path.join(path, "summaries")
+        if os.path.exists(os.path.join(summaries_path, "manifest.json")):
+            summary_collection = self.chroma_client.get_or_create_collection(self.get_summary_collection_name(collection_name))
+            summaries = import_collection(summary_collection, summaries_path, batch_size)["count"]
+        return {**manifest, "collection": collection_name, "path": path, "summaries": summaries}
+
     def translate_to_spanish(self, text: str) -> str:
         """
         Translate text from any language to Spanish using OpenAI API.
@@ -359,6 +1059,14 @@ class RagAPI:
         """
         return self.translate_text(text, target_language="Spanish")
         
+    def get_translate_client(self):
+        if self.translate_client is None:
+            from openai import OpenAI
+            self.translate_client = OpenAI(
+                api_key=self.openai_api_key, http_client=self.governor.http_client(), max_retries=0
+            )
+        return self.translate_client
+
     def translate_text(self, text: str, target_language: str = "Spanish") -> dict:
         """
         Translate text from any language to the specified target language using OpenAI API.
@@ -371,9 +1079,7 @@ class RagAPI:
             Dictionary containing the original text and the translated text.
         """
         try:
-            from openai import OpenAI
-            
-            client = OpenAI(api_key=self.openai_api_key)
+            client = self.get_translate_client()
             
             completion = client.chat.completions.create(
                 model="gpt-4o-mini",
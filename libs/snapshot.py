@@ -0,0 +1,211 @@
+"""
+Columnar collection snapshots.
+
+A snapshot is a directory holding one column per file so a restore only reads
+and upserts what is already computed, without parsing or embedding again:
+
+    manifest.json         collection name, row count, embedding dimension;
+                          written last, a snapshot without one is incomplete
+    embeddings.npy        float32 (rows, dim), memory-mapped on import
+    ids.bin / ids.npy     UTF-8 strings concatenated, int64 end offsets
+    texts.bin / texts.npy
+    metadatas.bin / metadatas.npy   one JSON object per row
+
+Any collection exposing the Chroma `count` / `get` / `upsert` API can be
+exported or imported (Chroma and the NumPy store), so a snapshot also moves a
+collection between backends.
+
+    python -m libs.snapshot export reports ./snapshots/reports
+    python -m libs.snapshot import ./snapshots/reports reports_copy
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+SNAPSHOT_FORMAT_VERSION = 1
+STRING_COLUMNS = ("ids", "texts", "metadatas")
+
+
+class StringColumnWriter:
+    """
+    Append-only variable-length string column: the UTF-8 bytes of every
+    value back to back, plus the end offset of each value.
+    """
+
+    def __init__(self, path: str, name: str):
+        self.data_path = os.path.join(path, f"{name}.bin")
+        self.offsets_path = os.path.join(path, f"{name}.npy")
+        self.file = open(self.data_path, "wb")
+        self.offsets = []
+        self.size = 0
+
+    def extend(self, values):
+        for value in values:
+            encoded = value.encode("utf-8")
+            self.file.write(encoded)
+            self.size += len(encoded)
+            self.offsets.append(self.size)
+
+    def close(self):
+        self.file.close()
+        np.save(self.offsets_path, np.asarray(self.offsets, dtype=np.int64))
+
+
+class StringColumnReader:
+    """
+    Memory-mapped reader of a StringColumnWriter column.
+    """
+
+    def __init__(self, path: str, name: str):
+        self.offsets = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        data_path = os.path.join(path, f"{name}.bin")
+        # np.memmap refuses empty files
+        self.data = np.memmap(data_path, dtype=np.uint8, mode="r") if os.path.getsize(data_path) else b""
+
+    def slice(self, start: int, end: int):
+        offsets = np.asarray(self.offsets[start:end])
+        first = int(self.offsets[start - 1]) if start > 0 else 0
+        chunk = bytes(self.data[first:int(offsets[-1])]) if len(offsets) else b""
+        values, previous = [], 0
+        for offset in offsets - first:
+            values.append(chunk[previous:offset].decode("utf-8"))
+            previous = offset
+        return values
+
+
+def read_manifest(path: str) -> dict:
+    manifest_path = os.path.join(path, "manifest.json")
+    if not os.path.exists(manifest_path):
+        raise FileNotFoundError(f"No snapshot found at {path}")
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def export_collection(collection, collection_name: str, path: str, batch_size: int = 5000) -> dict:
+    """
+    Write a collection to a snapshot directory, reading it in batches.
+
+    Args:
+        collection: A Chroma (or NumPy store) collection.
+        collection_name: The name recorded in the snapshot manifest.
+        path: The snapshot directory, created if needed.
+        batch_size: Rows read from the vector store per call.
+
+    Returns:
+        The snapshot manifest.
+    """
+    os.makedirs(path, exist_ok=True)
+    # The manifest is written last: an export in progress (or failed) over an
+    # older snapshot has none, so it is never imported
+    manifest_path = os.path.join(path, "manifest.json")
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    total = collection.count()
+    columns = {name: StringColumnWriter(path, name) for name in STRING_COLUMNS}
+    embeddings = None
+    rows = 0
+    try:
+        for offset in range(0, total, batch_size):
+            batch = collection.get(limit=batch_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+            if not batch["ids"]:
+                break
+            vectors = np.asarray(batch["embeddings"], dtype=np.float32)
+            if embeddings is None:
+                embeddings = np.lib.format.open_memmap(
+                    os.path.join(path, "embeddings.npy"), mode="w+", dtype=np.float32, shape=(total, vectors.shape[1])
+                )
+            embeddings[rows:rows + len(vectors)] = vectors
+            columns["ids"].extend(batch["ids"])
+            columns["texts"].extend(text or "" for text in batch["documents"])
+            columns["metadatas"].extend(json.dumps(metadata or {}) for metadata in batch["metadatas"])
+            rows += len(batch["ids"])
+    finally:
+        for column in columns.values():
+            column.close()
+
+    dim = 0
+    if embeddings is None:
+        np.save(os.path.join(path, "embeddings.npy"), np.empty((0, 0), dtype=np.float32))
+    else:
+        dim = embeddings.shape[1]
+        embeddings.flush()
+        del embeddings
+        if rows != total:
+            # Rows were deleted while exporting, trim the preallocated matrix
+            trimmed = np.array(np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")[:rows])
+            np.save(os.path.join(path, "embeddings.npy"), trimmed)
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "collection": collection_name,
+        "count": rows,
+        "dim": dim,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return manifest
+
+
+def import_collection(collection, path: str, batch_size: int = 5000) -> dict:
+    """
+    Bulk-upsert a snapshot directory into a collection.
+
+    Args:
+        collection: A Chroma (or NumPy store) collection.
+        path: The snapshot directory.
+        batch_size: Rows upserted per call.
+
+    Returns:
+        The snapshot manifest.
+    """
+    manifest = read_manifest(path)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version: {manifest.get('format_version')}")
+
+    embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+    columns = {name: StringColumnReader(path, name) for name in STRING_COLUMNS}
+    for start in range(0, manifest["count"], batch_size):
+        end = min(start + batch_size, manifest["count"])
+        collection.upsert(
+            ids=columns["ids"].slice(start, end),
+            embeddings=np.asarray(embeddings[start:end]).tolist(),
+            documents=columns["texts"].slice(start, end),
+            metadatas=[json.loads(metadata) for metadata in columns["metadatas"].slice(start, end)],
+        )
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import collection snapshots")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Export a collection to a snapshot directory")
+    export_parser.add_argument("collection", help="Collection to export")
+    export_parser.add_argument("path", help="Snapshot directory")
+    import_parser = subparsers.add_parser("import", help="Import a snapshot directory into a new collection")
+    import_parser.add_argument("path", help="Snapshot directory")
+    import_parser.add_argument("collection", nargs="?", default=None, help="Target collection (default: the exported name)")
+    import_parser.add_argument("--overwrite", action="store_true", help="Replace the target collection if it has data")
+    for subparser in (export_parser, import_parser):
+        subparser.add_argument("--batch-size", type=int, default=5000, help="Rows read or upserted per call")
+    args = parser.parse_args()
+
+    # Same configuration as the API server
+    from main import build_rag_api
+    rag_api = build_rag_api()
+
+    started = time.perf_counter()
+    if args.command == "export":
+        result = rag_api.export_collection(args.collection, path=args.path, batch_size=args.batch_size)
+    else:
+        result = rag_api.import_collection(args.path, args.collection, overwrite=args.overwrite, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - started
+    print(json.dumps(result, indent=2))
+    print(f"{result['count']} rows in {elapsed:.1f}s ({result['count'] / max(elapsed, 1e-9):.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
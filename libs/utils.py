@@ -1,16 +1,17 @@
 import os
 import re
 
-
-from llama_index.llms.openai import OpenAI
+# Model client packages are imported inside the factories below so they are
+# only loaded for the provider actually in use.
 # from llama_index.llms.groq import Groq
 # from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.embeddings.ollama import OllamaEmbedding
-
 
 from typing import Union, List
 
+from libs.data import overview_question_patterns
+
+overview_question_re = re.compile("|".join(overview_question_patterns), re.IGNORECASE)
+
 
 def sanitize_metadata(metadata: dict, doc_type: str) -> dict:
     sanitized = {}
@@ -48,17 +49,43 @@ def transform_metadata(raw_metadata: dict, doc_type: Union[str, None]) -> List[d
     return results
 
 
-def get_llm(provider: str, model_name: str):
-    return OpenAI(model_name=model_name, api_key=os.environ["OPENAI_API_KEY"])
+def is_overview_question(question: str) -> bool:
+    """
+    Whether the question asks what a document or collection is about, which
+    can be answered from the precomputed summaries.
+    """
+    return bool(overview_question_re.search(question))
+
+
+def get_governed_client_kwargs(governor) -> dict:
+    """
+    OpenAI client arguments that route requests through a RateGovernor,
+    which then owns the retries.
+    """
+    if governor is None:
+        return {}
+    return {
+        "http_client": governor.http_client(),
+        "async_http_client": governor.async_http_client(),
+        "max_retries": 0,
+    }
+
+
+def get_llm(provider: str, model_name: str, governor=None):
+    from llama_index.llms.openai import OpenAI
+    return OpenAI(model_name=model_name, api_key=os.environ["OPENAI_API_KEY"], **get_governed_client_kwargs(governor))
 
     
-def get_embed_model(provider: str, llm_embeddings_model: str):
+def get_embed_model(provider: str, llm_embeddings_model: str, governor=None):
     if provider == "openai":
+        from llama_index.embeddings.openai import OpenAIEmbedding
         return OpenAIEmbedding(
             model_name=llm_embeddings_model, 
-            api_key=os.environ["OPENAI_API_KEY"]
+            api_key=os.environ["OPENAI_API_KEY"],
+            **get_governed_client_kwargs(governor)
         )
     elif provider == "ollama":
+        from llama_index.embeddings.ollama import OllamaEmbedding
         return OllamaEmbedding(
             model_name=llm_embeddings_model,
             base_url="http://localhost:11434",
@@ -66,5 +93,28 @@ def get_embed_model(provider: str, llm_embeddings_model: str):
         )
     else:
         return "No provider selected"
-    
- 
+
+
+def get_db_client(backend: str, path: str = None, **chroma_kwargs):
+    """
+    Build the vector database client for the configured backend.
+
+    Args:
+        backend: "http" (Chroma server), "persistent" (in-process Chroma on `path`)
+            or "numpy" (memory-mapped flat index on `path`).
+        path: The storage directory for the local backends.
+        chroma_kwargs: Connection settings for the Chroma server.
+
+    Returns:
+        A client exposing get_or_create_collection, get_vector_store,
+        list_collections, delete_collection and heartbeat.
+    """
+    if backend == "numpy":
+        from db.numpy_store import NumpyDBClient
+        return NumpyDBClient(path=path)
+    from db.chroma import ChromaDBClient
+    if backend == "persistent":
+        return ChromaDBClient(mode="persistent", path=path)
+    if backend == "http":
+        return ChromaDBClient(mode="http", **chroma_kwargs)
+    raise ValueError(f"Unknown vector store backend: {backend}")
@@ -3,15 +3,15 @@ import asyncio
 import nest_asyncio
 nest_asyncio.apply()  # Enable nested asyncio event loops
 
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
 from fastapi import FastAPI, UploadFile, File, Query, Form, Depends, HTTPException, Security
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from anyio import to_thread
 
-from db.chroma import ChromaDBClient
-from llama_index.core import Settings
-from llama_index.core.prompts import PromptTemplate
-
-from libs.data import template
-from libs.rag import RagAPI
+from libs.data import template, template_var_mappings
 
 from dotenv import load_dotenv
 
@@ -24,6 +24,10 @@ security = HTTPBearer()
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
 VISION_MODEL = os.getenv("VISION_MODEL", "openai/gpt-4o")
 AI_PROVIDER = os.getenv("AI_PROVIDER", "openai")
+# Vector store backend: "http" (Chroma server), "persistent" (in-process Chroma)
+# or "numpy" (memory-mapped flat index); the last two store under VECTOR_STORE_PATH
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "http")
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "./data/vectors")
 CHROMA_HOST = os.getenv("CHROMA_HOST", "localhost")
 CHROMA_PORT = os.getenv("CHROMA_PORT", "8000")
 CHROMA_CLIENT_AUTH_CREDENTIALS = os.getenv("CHROMA_CLIENT_AUTH_CREDENTIALS")
@@ -32,28 +36,77 @@ CHROMA_AUTH_TOKEN_TRANSPORT_HEADER = os.getenv("CHROMA_AUTH_TOKEN_TRANSPORT_HEAD
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 TIMEOUT = int(os.getenv("TIMEOUT", "600"))
 USE_METADATA = int(os.getenv("USE_METADATA", 0))
+# Startup retries while Chroma (or the model clients) are not reachable yet
+STARTUP_RETRY_DELAY = float(os.getenv("STARTUP_RETRY_DELAY", "1"))
+STARTUP_RETRY_MAX_DELAY = float(os.getenv("STARTUP_RETRY_MAX_DELAY", "30"))
+# Worker threads for the sync endpoints (queries, translation), per process
+THREADPOOL_SIZE = int(os.getenv("THREADPOOL_SIZE", "40"))
 
 use_metadata_pipeline = True if USE_METADATA==1 else False
 
+# Settings.llm = get_llm(provider=AI_PROVIDER, model_name=LLM_MODEL)
+# Settings.embed_model = get_embed_model(provider=AI_PROVIDER)
 
-# Print all environment variables
-print("Environment variables:")
-for key, value in os.environ.items():
-    print(f"{key}: {value}")
+# Filled in by the lifespan once the clients are up; heavy imports
+# (llama_index, chromadb, openai) happen there and not at module import.
+state = {"rag_api": None, "ready": False, "error": None, "attempts": 0}
 
-qa_template = PromptTemplate(template)
-chroma_client = ChromaDBClient(
-    host=CHROMA_HOST, 
-    port=CHROMA_PORT, 
-    auth_credentials=CHROMA_CLIENT_AUTH_CREDENTIALS,
-    auth_provider=CHROMA_SERVER_AUTHN_PROVIDER,
-    auth_token_transport_header=CHROMA_AUTH_TOKEN_TRANSPORT_HEADER
-)
 
-rag_api = RagAPI(chroma_client, qa_template, OPENAI_API_KEY, VISION_MODEL, use_metadata_pipeline = use_metadata_pipeline)
+def build_rag_api():
+    from llama_index.core.prompts import PromptTemplate
+    from libs.rag import RagAPI
+    from libs.utils import get_db_client
 
-# Settings.llm = get_llm(provider=AI_PROVIDER, model_name=LLM_MODEL)
-# Settings.embed_model = get_embed_model(provider=AI_PROVIDER)
+    qa_template = PromptTemplate(template, template_var_mappings=template_var_mappings)
+    chroma_client = get_db_client(
+        VECTOR_STORE_BACKEND,
+        path=VECTOR_STORE_PATH,
+        host=CHROMA_HOST, 
+        port=CHROMA_PORT, 
+        auth_credentials=CHROMA_CLIENT_AUTH_CREDENTIALS,
+        auth_provider=CHROMA_SERVER_AUTHN_PROVIDER,
+        auth_token_transport_header=CHROMA_AUTH_TOKEN_TRANSPORT_HEADER
+    )
+    return RagAPI(chroma_client, qa_template, OPENAI_API_KEY, VISION_MODEL, use_metadata_pipeline = use_metadata_pipeline)
+
+
+async def init_rag_api():
+    """
+    Build the RagAPI, retrying with exponential backoff until Chroma and
+    the model clients can be initialized. Runs in the background so the
+    process stays live (and reports not-ready) while dependencies start.
+    """
+    delay = STARTUP_RETRY_DELAY
+    while True:
+        state["attempts"] += 1
+        try:
+            state["rag_api"] = await to_thread.run_sync(build_rag_api)
+            state["ready"] = True
+            state["error"] = None
+            print(f"RAG API initialized after {state['attempts']} attempt(s)")
+            return
+        except Exception as e:
+            state["error"] = str(e)
+            print(f"RAG API initialization failed (attempt {state['attempts']}): {str(e)}. Retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, STARTUP_RETRY_MAX_DELAY)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    init_task = asyncio.create_task(init_rag_api())
+    yield
+    init_task.cancel()
+
+
+async def get_rag_api():
+    """
+    Return the initialized RagAPI, or 503 while it is still starting up.
+    """
+    if not state["ready"]:
+        raise HTTPException(status_code=503, detail="RAG API is starting up, try again shortly")
+    return state["rag_api"]
 
 def verify_token(credentials: HTTPAuthorizationCredentials = Security(security)) -> bool:
     """
@@ -74,7 +127,30 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Security(security))
         )
     return True
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+@app.get("/healthz")
+def liveness_endpoint():
+    """
+    Liveness probe: the process is up and serving requests.
+    """
+    return {"status": "alive"}
+
+@app.get("/readyz")
+def readiness_endpoint():
+    """
+    Readiness probe: the clients are initialized and the vector store answers.
+    """
+    if not state["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "starting", "attempts": state["attempts"], "error": state["error"]},
+        )
+    try:
+        state["rag_api"].chroma_client.heartbeat()
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"status": "unavailable", "error": str(e)})
+    return {"status": "ready"}
 
 @app.post("/v1/rag/upload")
 async def upload_endpoint(
@@ -91,7 +167,12 @@ async def upload_endpoint(
         default="pymupdf",
         description="Loader to use for processing the document"
     ),
-    authenticated: bool = Depends(verify_token)
+    summarize: Optional[bool] = Form(
+        default=None,
+        description="Precompute document and collection summaries (default: SUMMARIZE_ON_INGEST)"
+    ),
+    authenticated: bool = Depends(verify_token),
+    rag_api = Depends(get_rag_api)
 ):
     print(f"Uploading document to collection: {collection_name}")
     print(f"Document type: {doc_type}")
@@ -99,7 +180,7 @@ async def upload_endpoint(
     print(f"File: {file}")
 
     result = await asyncio.wait_for(
-        rag_api.upload_document(file, collection_name, doc_type, loader),
+        rag_api.upload_document(file, collection_name, doc_type, loader, summarize),
         timeout=TIMEOUT
     )
     return result
@@ -110,33 +191,80 @@ def query_endpoint(
     doc_type: str = Query(None),
     collection_name: str = Query("default_collection"),
     response_mode: str = Query("compact"),
-    authenticated: bool = Depends(verify_token)
+    collection_names: List[str] = Query(None, description="Query several collections and merge the results"),
+    collection_pattern: str = Query(None, description="Glob or prefix matched against the existing collections"),
+    top_k: Optional[int] = Query(None, ge=1, le=50, description="Nodes used for the answer (default 3); with response_mode=auto, the candidates considered"),
+    authenticated: bool = Depends(verify_token),
+    rag_api = Depends(get_rag_api)
 ):
     print(f"Querying document: {q}")
     print(f"Document type: {doc_type}")
-    print(f"Collection name: {collection_name}")
+    print(f"Collection name: {collection_names or collection_pattern or collection_name}")
     print(f"Response mode: {response_mode}")
-    return rag_api.query_documents(q, doc_type, collection_name, response_mode)
+    if collection_names or collection_pattern:
+        return rag_api.query_collections(q, doc_type, collection_names, collection_pattern, response_mode, top_k=top_k)
+    return rag_api.query_documents(q, doc_type, collection_name, response_mode, top_k=top_k)
 
 @app.get("/v1/rag/info")
-def info_endpoint(authenticated: bool = Depends(verify_token)):
+def info_endpoint(authenticated: bool = Depends(verify_token), rag_api = Depends(get_rag_api)):
     return rag_api.get_info()
 
+@app.get("/v1/rag/metrics")
+def metrics_endpoint(authenticated: bool = Depends(verify_token), rag_api = Depends(get_rag_api)):
+    return rag_api.get_metrics()
+
 @app.get("/v1/rag/collections")
-def collections_endpoint(authenticated: bool = Depends(verify_token)):
+def collections_endpoint(authenticated: bool = Depends(verify_token), rag_api = Depends(get_rag_api)):
     return rag_api.list_all_collections()
 
 
 # Delete collection by name
 @app.delete("/v1/rag/collections/{collection_name}")
-def delete_collection_endpoint(collection_name: str, authenticated: bool = Depends(verify_token)):
+def delete_collection_endpoint(collection_name: str, authenticated: bool = Depends(verify_token), rag_api = Depends(get_rag_api)):
     print(f"Deleting collection: {collection_name}")
     return rag_api.delete_collection(collection_name)
 
+@app.get("/v1/rag/collections/{collection_name}/query-target")
+def get_query_target_endpoint(collection_name: str, authenticated: bool = Depends(verify_token), rag_api = Depends(get_rag_api)):
+    return {"collection": collection_name, **rag_api.get_query_target(collection_name)}
+
+@app.put("/v1/rag/collections/{collection_name}/query-target")
+def set_query_target_endpoint(
+    collection_name: str,
+    max_llm_calls: Optional[int] = Query(None, ge=1, description="LLM calls allowed per query with response_mode=auto"),
+    max_latency_ms: Optional[int] = Query(None, ge=1, description="Synthesis latency allowed per query with response_mode=auto"),
+    authenticated: bool = Depends(verify_token),
+    rag_api = Depends(get_rag_api)
+):
+    print(f"Setting query target of collection {collection_name}: {max_llm_calls} calls, {max_latency_ms} ms")
+    return rag_api.set_query_target(collection_name, max_llm_calls=max_llm_calls, max_latency_ms=max_latency_ms)
+
+@app.post("/v1/rag/collections/{collection_name}/export")
+def export_collection_endpoint(
+    collection_name: str,
+    snapshot_name: str = Query(None, description="Snapshot directory under SNAPSHOT_DIR (default: the collection name)"),
+    authenticated: bool = Depends(verify_token),
+    rag_api = Depends(get_rag_api)
+):
+    print(f"Exporting collection: {collection_name}")
+    return rag_api.export_collection(collection_name, snapshot_name=snapshot_name)
+
+@app.post("/v1/rag/collections/{collection_name}/import")
+def import_collection_endpoint(
+    collection_name: str,
+    snapshot_name: str = Query(..., description="Snapshot directory under SNAPSHOT_DIR"),
+    overwrite: bool = Query(False, description="Replace the collection if it already holds data"),
+    authenticated: bool = Depends(verify_token),
+    rag_api = Depends(get_rag_api)
+):
+    print(f"Importing snapshot {snapshot_name} into collection: {collection_name}")
+    return rag_api.import_collection(rag_api.get_snapshot_path(snapshot_name), collection_name, overwrite=overwrite)
+
 @app.post("/v1/translate/to-spanish")
 def translate_to_spanish_endpoint(
     text: str = Query(..., description="Text to translate to Spanish"),
-    authenticated: bool = Depends(verify_token)
+    authenticated: bool = Depends(verify_token),
+    rag_api = Depends(get_rag_api)
 ):
     """
     Translate text from any language to Spanish.
@@ -154,7 +282,8 @@ def translate_to_spanish_endpoint(
 def translate_endpoint(
     text: str = Query(..., description="Text to translate"),
     target_language: str = Query("Spanish", description="Target language for translation"),
-    authenticated: bool = Depends(verify_token)
+    authenticated: bool = Depends(verify_token),
+    rag_api = Depends(get_rag_api)
 ):
     """
     Translate text from any language to the specified target language.
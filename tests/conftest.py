@@ -0,0 +1,103 @@
+import re
+import time
+from typing import Any
+
+import pytest
+
+try:
+    from llama_index.core.llms import CustomLLM, CompletionResponse, LLMMetadata
+    from llama_index.core.llms.callbacks import llm_completion_callback
+except ImportError:
+    # Tests that need llama_index skip themselves
+    CustomLLM = None
+
+
+if CustomLLM is not None:
+
+    class CountingLLM(CustomLLM):
+        """
+        Mock LLM that always answers "Quarterly report" and counts its calls.
+        """
+        calls: int = 0
+        context_window: int = 128000
+
+        @property
+        def metadata(self) -> LLMMetadata:
+            return LLMMetadata(context_window=self.context_window, num_output=256)
+
+        @llm_completion_callback()
+        def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+            self.calls += 1
+            return CompletionResponse(text="Quarterly report")
+
+        @llm_completion_callback()
+        def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+            raise NotImplementedError
+
+    class RecordingLLM(CountingLLM):
+        """
+        Mock LLM that answers with the question found in its prompt, so a
+        crossed prompt shows up as an answer to someone else's question.
+        """
+        prompts: list = []
+
+        @llm_completion_callback()
+        def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+            # Give other threads a chance to run between prompt build and answer
+            time.sleep(0.001)
+            self.prompts.append(prompt)
+            question = re.search(r"Question: (.*)", prompt).group(1).strip()
+            return CompletionResponse(text=f"ANSWER:{question}")
+
+
+@pytest.fixture
+def make_rag_api(monkeypatch, tmp_path):
+    """
+    Factory of RagAPI instances wired to mock models and to state directories
+    under tmp_path.
+
+    Args (of the factory):
+        backend: The vector store backend passed to get_db_client.
+        use_metadata_pipeline: Enable the metadata extraction pipeline.
+        llm_query: The query LLM (default a CountingLLM).
+        context_window: Context window of the default query LLM.
+        **env: Extra environment variables read by RagAPI.__init__.
+    """
+    pytest.importorskip("llama_index.core")
+    from llama_index.core.embeddings import MockEmbedding
+    from llama_index.core.prompts import PromptTemplate
+
+    from libs.data import template, template_var_mappings
+    from libs.rag import RagAPI
+    from libs.utils import get_db_client
+
+    def make(backend="numpy", use_metadata_pipeline=False, llm_query=None, context_window=128000, **env):
+        monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+        monkeypatch.setenv("PIPELINE_CACHE_DIR", str(tmp_path / "pipeline_cache"))
+        monkeypatch.setenv("SNAPSHOT_DIR", str(tmp_path / "snapshots"))
+        monkeypatch.setenv("QUERY_TARGETS_PATH", str(tmp_path / "query_targets.json"))
+        for key, value in env.items():
+            monkeypatch.setenv(key, str(value))
+
+        qa_template = PromptTemplate(template, template_var_mappings=template_var_mappings)
+        db_client = get_db_client(backend, path=str(tmp_path / backend))
+        api = RagAPI(db_client, qa_template, "sk-test", "openai/gpt-4o", use_metadata_pipeline=use_metadata_pipeline)
+        api.llm_transformations = CountingLLM()
+        api.llm_query = llm_query or CountingLLM(context_window=context_window)
+        api.llm_embedding = MockEmbedding(embed_dim=8)
+        # Translation calls OpenAI directly, keep the answer as is
+        monkeypatch.setattr(api, "translate_text", lambda text, target_language="Spanish": {"translated": text})
+        return api
+
+    return make
+
+
+@pytest.fixture
+def recording_llm():
+    pytest.importorskip("llama_index.core")
+    return RecordingLLM()
+
+
+@pytest.fixture
+def rag_api(make_rag_api):
+    return make_rag_api()
@@ -0,0 +1,121 @@
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from libs.planner import plan_synthesis, select_nodes
+
+
+def test_plan_picks_the_cheapest_mode_within_the_target():
+    # All the context fits one prompt
+    assert plan_synthesis([1, 1, 1], 1000)["response_mode"] == "compact"
+    assert plan_synthesis([1, 1, 1], 1000)["estimated_llm_calls"] == 1
+    # No target: refine over every pack
+    assert plan_synthesis([1, 2, 3], 1000) == {
+        "response_mode": "compact", "top_k": 3, "estimated_llm_calls": 3, "estimated_latency_ms": 3000
+    }
+    # Latency target: answer the packs in parallel
+    assert plan_synthesis([1, 2, 3], 1000, max_latency_ms=2500)["response_mode"] == "tree_summarize"
+    # Cost target: drop the lowest-scoring nodes
+    plan = plan_synthesis([1, 2, 3], 1000, max_llm_calls=2)
+    assert (plan["response_mode"], plan["top_k"], plan["estimated_llm_calls"]) == ("compact", 2, 2)
+
+
+def test_select_nodes_keeps_candidates_close_to_the_best_score():
+    nodes = [NodeWithScore(node=TextNode(text=str(score)), score=score) for score in (0.3, 0.95, 0.9, 0.5)]
+    assert [n.score for n in select_nodes(nodes, min_k=2, relative_cutoff=0.8)] == [0.95, 0.9]
+    assert [n.score for n in select_nodes(nodes, min_k=3, relative_cutoff=0.8)] == [0.95, 0.9, 0.5]
+    assert [n.score for n in select_nodes(nodes, min_k=1, relative_cutoff=0.8, score_cutoff=0.92)] == [0.95]
+
+
+@pytest.fixture
+def rag_api(make_rag_api, monkeypatch):
+    # A small context window, so every relevant node fills a prompt
+    api = make_rag_api(context_window=1000, LLM_CALL_LATENCY_MS=1000)
+    # Keep the per-call latency estimate fixed for the test
+    monkeypatch.setattr(api, "observe_llm_latency", lambda elapsed, calls: None)
+
+    relevant = [
+        TextNode(id_=f"relevant-{i}", text=f"Revenue detail {i}. " + "figures " * 400,
+                 metadata={"doc_type": "GENERIC"}, embedding=[1.0] * 8)
+        for i in range(3)
+    ]
+    unrelated = [TextNode(id_="unrelated", text="Cafeteria menu.", metadata={"doc_type": "GENERIC"},
+                          embedding=[1.0] + [0.0] * 7)]
+    api.chroma_client.get_vector_store("auto_collection").add(relevant + unrelated)
+    return api
+
+
+def test_auto_mode_reports_the_mode_and_calls_and_follows_the_collection_target(rag_api):
+    result = rag_api.query_documents("What was the revenue?", None, "auto_collection", "auto")
+    # The unrelated node is cut, each relevant node fills a prompt of the small window
+    assert (result["response_mode"], result["top_k"], result["llm_calls"]) == ("compact", 3, 3)
+
+    rag_api.set_query_target("auto_collection", max_latency_ms=2500)
+    result = rag_api.query_documents("What was the revenue?", None, "auto_collection", "auto")
+    assert (result["response_mode"], result["top_k"], result["llm_calls"]) == ("tree_summarize", 3, 4)
+
+    rag_api.set_query_target("auto_collection", max_llm_calls=1)
+    result = rag_api.query_collections("What was the revenue?", None, ["auto_collection"], None, "auto")
+    assert (result["response_mode"], result["top_k"], result["llm_calls"]) == ("compact", 1, 1)
+
+    # Fixed modes still work and report their calls
+    result = rag_api.query_documents("What was the revenue?", None, "auto_collection", "compact", top_k=2)
+    assert (result["response_mode"], result["top_k"]) == ("compact", 2)
+    assert result["llm_calls"] >= 1
+
+
+def test_only_the_synthesis_is_timed_for_the_latency_estimate(make_rag_api, monkeypatch):
+    import time
+    from llama_index.core.embeddings import MockEmbedding
+
+    class SlowEmbedding(MockEmbedding):
+        def _get_query_embedding(self, query):
+            time.sleep(0.3)
+            return super()._get_query_embedding(query)
+
+    api = make_rag_api()
+    api.chroma_client.get_vector_store("timed_collection").add([
+        TextNode(id_="node", text="Revenue grew.", metadata={"doc_type": "GENERIC"}, embedding=[1.0] * 8)
+    ])
+    api.llm_embedding = SlowEmbedding(embed_dim=8)
+    observed = []
+    monkeypatch.setattr(api, "observe_llm_latency", lambda elapsed, calls: observed.append((elapsed, calls)))
+
+    for mode in ("compact", "auto"):
+        result = api.query_documents("What was the revenue?", None, "timed_collection", mode)
+        assert result["llm_calls"] == 1
+    api.query_collections("What was the revenue?", None, ["timed_collection"], None, "compact")
+
+    assert [calls for _, calls in observed] == [1, 1, 1]
+    assert all(elapsed < 0.3 for elapsed, _ in observed)
+
+
+def test_query_targets_are_cached_and_shared_between_workers(make_rag_api, monkeypatch):
+    import json
+    import threading
+
+    worker_a, worker_b = make_rag_api(), make_rag_api()
+    assert worker_a.query_targets_path == worker_b.query_targets_path
+
+    # Concurrent writers (as separate workers would be) don't lose each other's targets
+    threads = [
+        threading.Thread(target=worker.set_query_target, args=(f"collection_{i}",), kwargs={"max_llm_calls": i + 1})
+        for i, worker in enumerate([worker_a, worker_b] * 4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(worker_b.read_query_targets()) == [f"collection_{i}" for i in range(8)]
+
+    # Queries reuse the parsed targets until another worker replaces the file
+    loads = []
+    load = json.load
+    monkeypatch.setattr(json, "load", lambda f: loads.append(1) or load(f))
+    worker_b.get_query_target("collection_0")
+    worker_b.get_query_target("collection_1")
+    assert loads == []
+    worker_a.set_query_target("collection_0", max_latency_ms=500)
+    assert worker_b.get_query_target("collection_0") == {"max_llm_calls": None, "max_latency_ms": 500}
@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from libs.governor import (
+    AsyncGovernedTransport, GovernedTransport, RateGovernor, INGESTION_LANE, INTERACTIVE_LANE, use_lane,
+)
+
+
+def test_interactive_lane_is_served_before_queued_ingestion():
+    governor = RateGovernor(requests_per_minute=600, burst=1)
+    governor.tokens = 0
+    order = []
+
+    def call(lane):
+        with use_lane(lane):
+            governor.acquire()
+        order.append(lane)
+
+    threads = [threading.Thread(target=call, args=(INGESTION_LANE,)) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.03)
+    threads += [threading.Thread(target=call, args=(INTERACTIVE_LANE,)) for _ in range(3)]
+    for thread in threads[3:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert order == [INTERACTIVE_LANE] * 3 + [INGESTION_LANE] * 3
+    metrics = governor.metrics()["lanes"]
+    assert metrics[INGESTION_LANE]["requests"] == 3
+    assert metrics[INGESTION_LANE]["queue_depth"] == 0
+    assert metrics[INGESTION_LANE]["wait_seconds_max"] > metrics[INTERACTIVE_LANE]["wait_seconds_max"]
+
+
+def make_handler(responses):
+    calls = []
+
+    def handler(request):
+        calls.append(time.monotonic())
+        return responses[min(len(calls), len(responses)) - 1]
+    return handler, calls
+
+
+def test_throttled_requests_are_retried_after_retry_after():
+    governor = RateGovernor(requests_per_minute=0)
+    handler, calls = make_handler([
+        httpx.Response(429, headers={"retry-after-ms": "100"}),
+        httpx.Response(200, json={"ok": True}),
+    ])
+    client = httpx.Client(transport=GovernedTransport(governor, httpx.MockTransport(handler)))
+
+    response = client.post("https://api.example.com/v1/chat/completions", json={})
+    assert response.status_code == 200
+    assert calls[1] - calls[0] >= 0.1
+    metrics = governor.metrics()
+    assert (metrics["retries"], metrics["throttled"]) == (1, 1)
+
+
+def test_async_transport_gives_up_after_max_retries():
+    governor = RateGovernor(requests_per_minute=0, max_retries=2, base_delay=0.01)
+    handler, calls = make_handler([httpx.Response(503)])
+
+    async def send():
+        async with httpx.AsyncClient(transport=AsyncGovernedTransport(governor, httpx.MockTransport(handler))) as client:
+            return await client.post("https://api.example.com/v1/embeddings", json={})
+
+    response = asyncio.run(send())
+    assert response.status_code == 503
+    assert len(calls) == 3
+    assert governor.metrics()["throttled"] == 0
+
+
+def test_connection_errors_are_retried_with_backoff():
+    governor = RateGovernor(requests_per_minute=0, max_retries=2, base_delay=0.01)
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        if len(calls) < 3:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, json={"ok": True})
+
+    client = httpx.Client(transport=GovernedTransport(governor, httpx.MockTransport(handler)))
+    assert client.post("https://api.example.com/v1/chat/completions", json={}).status_code == 200
+    assert governor.metrics()["transport_errors"] == 2
+
+    def timeout(request):
+        calls.append(request)
+        raise httpx.ReadTimeout("read timed out", request=request)
+
+    async def send():
+        transport = AsyncGovernedTransport(governor, httpx.MockTransport(timeout))
+        async with httpx.AsyncClient(transport=transport) as client:
+            return await client.post("https://api.example.com/v1/embeddings", json={})
+
+    calls.clear()
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(send())
+    assert len(calls) == 3
+
+
+def test_waiting_ingestion_does_not_block_the_event_loop_or_queries(make_rag_api):
+    from anyio import to_thread
+    from llama_index.core.embeddings import MockEmbedding
+    from llama_index.core.schema import Document
+
+    class GovernedEmbedding(MockEmbedding):
+        # Stand-in for the OpenAI embedding whose requests go through the governor
+        governor: RateGovernor
+
+        def _get_query_embedding(self, query):
+            self.governor.acquire()
+            return super()._get_query_embedding(query)
+
+        async def _aget_text_embeddings(self, texts):
+            await self.governor.aacquire()
+            return [self._get_vector() for _ in texts]
+
+        def _get_text_embeddings(self, texts):
+            self.governor.acquire()
+            return [self._get_vector() for _ in texts]
+
+    rag_api = make_rag_api()
+    asyncio.run(rag_api.index_documents([Document(text="The report covers revenue.")], "lane_collection"))
+    rag_api.governor = RateGovernor(requests_per_minute=120, burst=1)
+    rag_api.governor.tokens = 0
+    rag_api.llm_embedding = GovernedEmbedding(embed_dim=8, governor=rag_api.governor)
+
+    async def scenario():
+        with use_lane(INGESTION_LANE):
+            upload = asyncio.create_task(
+                rag_api.index_documents([Document(text="Another report.")], "lane_collection")
+            )
+        await asyncio.sleep(0.05)
+        query = asyncio.create_task(to_thread.run_sync(
+            rag_api.query_documents, "What does the report cover?", None, "lane_collection", "compact"
+        ))
+
+        # The loop keeps ticking while the upload waits for a token
+        max_gap, last = 0.0, time.monotonic()
+        while not query.done():
+            await asyncio.sleep(0.01)
+            now = time.monotonic()
+            max_gap, last = max(max_gap, now - last), now
+        upload_done_before_query = upload.done()
+        await upload
+        return max_gap, upload_done_before_query, await query
+
+    max_gap, upload_done_before_query, result = asyncio.run(scenario())
+    assert max_gap < 0.2
+    # The query arrived later but took the first token
+    assert not upload_done_before_query
+    assert result["answer"] == "Quarterly report"
+    assert rag_api.chroma_client.get_or_create_collection("lane_collection").count() == 2
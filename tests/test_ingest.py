@@ -0,0 +1,88 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("llama_index.core")
+pymupdf = pytest.importorskip("pymupdf")
+
+from libs.ingest import Manifest, ingest
+
+
+def write_pdf(path, pages):
+    doc = pymupdf.open()
+    for text in pages:
+        doc.new_page().insert_text((72, 72), text)
+    doc.save(str(path))
+
+
+@pytest.mark.parametrize("use_metadata_pipeline", [False, True])
+def test_directory_is_ingested_in_batches_and_resumed(make_rag_api, use_metadata_pipeline, tmp_path, monkeypatch):
+    # The metadata pipeline skips documents whose hashes it has seen, replaced
+    # files must be indexed again all the same
+    rag_api = make_rag_api(use_metadata_pipeline=use_metadata_pipeline)
+    source = tmp_path / "pdfs"
+    (source / "nested").mkdir(parents=True)
+    write_pdf(source / "a.pdf", ["first page of a", "second page of a"])
+    write_pdf(source / "nested" / "b.pdf", ["only page of b"])
+    (source / "notes.txt").write_text("not a pdf")
+    manifest = tmp_path / "manifest.json"
+
+    def run():
+        return asyncio.run(ingest(
+            rag_api, [str(source)], "bulk_collection", workers=2, batch_pages=2, manifest_path=str(manifest)
+        ))
+
+    progress = run()
+    assert (progress.files, progress.chunks, progress.failed) == (2, 3, 0)
+    assert rag_api.chroma_client.get_or_create_collection("bulk_collection").count() == 3
+    files = json.loads(manifest.read_text())["files"]
+    assert sorted(entry["chunks"] for entry in files.values()) == [1, 2]
+
+    # Completed files are skipped, changed files replace their previous chunks
+    assert run().files == 0
+    write_pdf(source / "nested" / "b.pdf", ["only page of b, revised"])
+    assert run().files == 1
+    collection = rag_api.chroma_client.get_or_create_collection("bulk_collection")
+    assert collection.count() == 3
+
+    # A crash after the upsert but before the checkpoint leaves the file pending
+    write_pdf(source / "a.pdf", ["first page of a, revised", "second page of a, revised"])
+
+    def crash(self, *args):
+        raise RuntimeError("killed")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(Manifest, "mark_done", crash)
+        with pytest.raises(RuntimeError):
+            run()
+    assert collection.count() == 3
+    assert run().files == 1
+    assert collection.count() == 3
+    texts = sorted(collection.get(include=["documents"])["documents"])
+    assert texts == ["first page of a, revised", "only page of b, revised", "second page of a, revised"]
+
+
+def test_collection_is_summarized_once_per_run(rag_api, tmp_path, monkeypatch):
+    source = tmp_path / "pdfs"
+    source.mkdir()
+    for name in ("a", "b", "c"):
+        write_pdf(source / f"{name}.pdf", [f"only page of {name}"])
+    summarize_collection = rag_api.summarize_collection
+    runs = []
+
+    async def count_collection_summaries(collection_name):
+        runs.append(collection_name)
+        await summarize_collection(collection_name)
+
+    monkeypatch.setattr(rag_api, "summarize_collection", count_collection_summaries)
+    # One file per batch
+    asyncio.run(ingest(
+        rag_api, [str(source)], "summarized_collection", workers=1, batch_pages=1,
+        manifest_path=str(tmp_path / "manifest.json"), summarize=True,
+    ))
+
+    assert runs == ["summarized_collection"]
+    summaries = rag_api.get_summaries("summarized_collection")
+    assert sorted(d["file_name"] for d in summaries["documents"]) == ["a.pdf", "b.pdf", "c.pdf"]
+    assert summaries["collection"] == "Quarterly report"
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from llama_index.core import StorageContext
+from llama_index.core.schema import Document
+from llama_index.core.vector_stores import VectorStoreQuery
+
+
+def make_docs():
+    return [
+        Document(text=f"Page {i} of the quarterly report. " * 20, metadata={"doc_type": "GENERIC", "page": i})
+        for i in range(3)
+    ]
+
+
+def ingest(api, collection_name):
+    storage_context = StorageContext.from_defaults(vector_store=api.chroma_client.get_vector_store(collection_name))
+    return asyncio.run(api.run_metadata_pipeline(make_docs(), collection_name, storage_context))
+
+
+def test_unchanged_documents_are_skipped_on_reprocessing(make_rag_api):
+    api = make_rag_api(use_metadata_pipeline=True, METADATA_MODE="inline")
+
+    _, nodes = ingest(api, "metadata_collection")
+    first_calls = api.llm_transformations.calls
+    assert nodes and first_calls > 0
+    assert all("document_title" in node.metadata for node in nodes)
+
+    _, nodes = ingest(api, "metadata_collection")
+    assert nodes == []
+    assert api.llm_transformations.calls == first_calls
+    assert api.chroma_client.get_or_create_collection("metadata_collection").count() == 3
+
+
+def test_deferred_enrichment_updates_indexed_nodes(make_rag_api):
+    api = make_rag_api(use_metadata_pipeline=True, METADATA_MODE="deferred")
+    store = api.chroma_client.get_vector_store("deferred_collection")
+
+    async def ingest_and_enrich():
+        storage_context = StorageContext.from_defaults(vector_store=store)
+        _, nodes = await api.run_metadata_pipeline(make_docs(), "deferred_collection", storage_context)
+        # Nodes are queryable before any extractor ran
+        before = store.query(VectorStoreQuery(query_embedding=[0.5] * 8, similarity_top_k=10))
+        assert len(before.nodes) == len(nodes)
+        assert all("document_title" not in node.metadata for node in before.nodes)
+        await api.wait_for_background_tasks()
+        return nodes
+
+    nodes = asyncio.run(ingest_and_enrich())
+
+    after = store.query(VectorStoreQuery(query_embedding=[0.5] * 8, similarity_top_k=10))
+    assert len(after.nodes) == len(nodes)
+    assert all(node.metadata["document_title"] == "Quarterly report" for node in after.nodes)
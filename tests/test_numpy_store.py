@@ -0,0 +1,123 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import ExactMatchFilter, MetadataFilters, VectorStoreQuery
+
+from db.numpy_store import NumpyDBClient
+
+
+def make_node(node_id, embedding, doc_type="GENERIC"):
+    return TextNode(id_=node_id, text=f"text of {node_id}", metadata={"doc_type": doc_type}, embedding=embedding)
+
+
+def test_query_ranks_by_cosine_similarity_and_filters(tmp_path):
+    store = NumpyDBClient(path=str(tmp_path)).get_vector_store("numpy_collection")
+    store.add([
+        make_node("a", [1.0, 0.0, 0.0]),
+        make_node("b", [0.7, 0.7, 0.0], doc_type="LEGAL"),
+        make_node("c", [0.0, 0.0, 1.0]),
+    ])
+
+    result = store.query(VectorStoreQuery(query_embedding=[1.0, 0.1, 0.0], similarity_top_k=2))
+    assert result.ids == ["a", "b"]
+    assert result.nodes[0].get_content() == "text of a"
+    assert result.similarities[0] > result.similarities[1]
+
+    filters = MetadataFilters(filters=[ExactMatchFilter(key="doc_type", value="LEGAL")])
+    result = store.query(VectorStoreQuery(query_embedding=[1.0, 0.1, 0.0], similarity_top_k=3, filters=filters))
+    assert result.ids == ["b"]
+
+
+def test_writes_are_persisted_and_seen_by_other_clients(tmp_path):
+    writer = NumpyDBClient(path=str(tmp_path)).get_vector_store("numpy_collection")
+    reader = NumpyDBClient(path=str(tmp_path)).get_vector_store("numpy_collection")
+    writer.add([make_node("a", [1.0, 0.0]), make_node("b", [0.0, 1.0])])
+
+    result = reader.query(VectorStoreQuery(query_embedding=[0.0, 1.0], similarity_top_k=1))
+    assert result.ids == ["b"]
+
+    # Re-adding a node replaces it instead of duplicating it
+    writer.add([make_node("b", [1.0, 0.0], doc_type="LEGAL")])
+    writer.delete_nodes(["a"])
+    assert reader.client.count() == 1
+    result = reader.query(VectorStoreQuery(query_embedding=[1.0, 0.0], similarity_top_k=5))
+    assert result.ids == ["b"]
+    assert result.nodes[0].metadata["doc_type"] == "LEGAL"
+
+
+def test_collections_are_listed_and_deleted(tmp_path):
+    client = NumpyDBClient(path=str(tmp_path))
+    client.get_vector_store("first_collection").add([make_node("a", [1.0, 0.0])])
+    client.get_or_create_collection("second_collection")
+    assert client.list_collections() == ["first_collection", "second_collection"]
+
+    client.delete_collection("first_collection")
+    assert client.list_collections() == ["second_collection"]
+    with pytest.raises(ValueError):
+        client.get_or_create_collection("../escape")
+
+
+def test_reload_does_not_mix_records_and_embeddings_of_different_writes(tmp_path):
+    writer = NumpyDBClient(path=str(tmp_path)).get_vector_store("numpy_collection")
+    reader = NumpyDBClient(path=str(tmp_path)).get_or_create_collection("numpy_collection")
+    writer.add([make_node("a", [1.0, 0.0])])
+
+    # Another worker writes after the reader has read the records but before
+    # it loads the embeddings
+    concurrent_write = threading.Thread(target=writer.add, args=([make_node("b", [0.0, 1.0])],))
+    embeddings_path = reader._embeddings_path
+
+    def write_then_load():
+        if concurrent_write.ident is None:
+            concurrent_write.start()
+            concurrent_write.join(0.2)
+        return embeddings_path()
+
+    reader._embeddings_path = write_then_load
+    count = reader.count()
+    assert len(reader._snapshot["embeddings"]) == len(reader._snapshot["ids"]) == count
+    concurrent_write.join()
+    assert reader.count() == 2
+    assert len(reader._snapshot["embeddings"]) == 2
+
+
+def test_new_rows_are_appended_in_place(tmp_path):
+    writer = NumpyDBClient(path=str(tmp_path)).get_vector_store("numpy_collection")
+    collection = writer._collection
+    writer.add([make_node("a", [1.0, 0.0])])
+    inodes = [os.stat(path).st_ino for path in (collection._records_path(), collection._embeddings_path())]
+
+    for i in range(20):
+        writer.add([make_node(f"n{i}", [0.0, 1.0 + i])])
+    assert [os.stat(path).st_ino for path in (collection._records_path(), collection._embeddings_path())] == inodes
+
+    reader = NumpyDBClient(path=str(tmp_path)).get_or_create_collection("numpy_collection")
+    assert reader.count() == 21
+    assert np.load(collection._embeddings_path()).shape == (21, 2)
+    result = writer.query(VectorStoreQuery(query_embedding=[1.0, 0.0], similarity_top_k=1))
+    assert result.ids == ["a"]
+
+    # An append interrupted after the embeddings and half of its record is dropped
+    with open(collection._embeddings_path(), "r+b") as f:
+        f.seek(0, os.SEEK_END)
+        f.write(np.ones(2, np.float32).tobytes())
+    with open(collection._records_path(), "a") as f:
+        f.write('{"id": "partial"')
+    reader = NumpyDBClient(path=str(tmp_path)).get_or_create_collection("numpy_collection")
+    assert reader.count() == 21
+    writer.add([make_node("b", [0.5, 0.5])])
+    reader = NumpyDBClient(path=str(tmp_path)).get_or_create_collection("numpy_collection")
+    assert reader.get(ids=["b"])["ids"] == ["b"]
+    assert len(reader._snapshot["embeddings"]) == len(reader._snapshot["ids"]) == 22
+
+    # Replacing or deleting rows still rewrites the collection
+    writer.add([make_node("a", [0.0, 1.0])])
+    writer.delete_nodes(["b"])
+    reader = NumpyDBClient(path=str(tmp_path)).get_or_create_collection("numpy_collection")
+    assert reader.count() == 21
@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("llama_index.core")
+pytest.importorskip("chromadb")
+
+from llama_index.core import VectorStoreIndex, StorageContext
+from llama_index.core.schema import Document
+
+NUM_QUESTIONS = 300
+CONTEXT_TEXT = "The Gobia report covers quarterly revenue."
+
+
+def seed_collection(api, collection_name, text):
+    storage_context = StorageContext.from_defaults(vector_store=api.chroma_client.get_vector_store(collection_name))
+    VectorStoreIndex.from_documents(
+        [Document(text=text, metadata={"doc_type": "GENERIC"})],
+        storage_context=storage_context,
+        embed_model=api.llm_embedding,
+    )
+
+
+@pytest.fixture(params=["persistent", "numpy"])
+def rag_api(request, make_rag_api, recording_llm):
+    api = make_rag_api(request.param, llm_query=recording_llm)
+    seed_collection(api, "concurrency_collection", CONTEXT_TEXT)
+    return api
+
+
+def test_concurrent_queries_do_not_cross_prompts(rag_api):
+    questions = [f"What is item number {i}?" for i in range(NUM_QUESTIONS)]
+
+    def ask(question):
+        return rag_api.query_documents(question, None, "concurrency_collection", "compact")
+
+    with ThreadPoolExecutor(max_workers=64) as pool:
+        results = list(pool.map(ask, questions))
+
+    for question, result in zip(questions, results):
+        assert result["question"] == question
+        assert result["answer"] == f"ANSWER:{question}"
+
+    assert len(rag_api.llm_query.prompts) == NUM_QUESTIONS
+    # The retrieved context must reach the prompt, not the literal placeholder
+    assert all(CONTEXT_TEXT in prompt for prompt in rag_api.llm_query.prompts)
+    # The shared template is never specialized for one question
+    assert "question" not in rag_api.qa_template.kwargs
+
+
+def test_fanout_query_merges_collections_into_one_synthesis(rag_api):
+    for name in ("tenant_a_docs", "tenant_b_docs"):
+        seed_collection(rag_api, name, f"Notes stored in {name}.")
+    rag_api.llm_query.prompts.clear()
+
+    result = rag_api.query_collections("Which tenants are there?", None, None, "tenant_", "simple_summarize", top_k=2)
+
+    assert sorted(result["collections"]) == ["tenant_a_docs", "tenant_b_docs"]
+    assert result["answer"] == "ANSWER:Which tenants are there?"
+    assert len(rag_api.llm_query.prompts) == 1
+    assert {entry["collection_name"] for entry in result["metadata"]} == {"tenant_a_docs", "tenant_b_docs"}
@@ -0,0 +1,21 @@
+from bench.replay import ReplayRequest, find_saturation, offered_rate, open_schedule
+
+
+def make_level(level, throughput, offered_rps):
+    return {"level": level, "throughput": throughput, "offered_rps": offered_rps, "error_rate": 0.0, "p95": 0.1}
+
+
+def test_replayed_offsets_are_offered_at_the_log_arrival_rate():
+    requests = [ReplayRequest(offset=i * 0.5, method="GET", path="/v1/rag/query") for i in range(5)]
+    # 4 intervals of 0.5s, replayed twice as fast
+    assert offered_rate(open_schedule(requests, time_scale=2.0)) == 4.0
+    assert offered_rate(open_schedule(requests[:1])) is None
+
+
+def test_open_loop_saturation_compares_throughput_to_the_offered_rate():
+    # A slow replayed log served at its own pace is not saturated
+    assert find_saturation([make_level(0.5, 0.49, 0.5)], "open", max_error_rate=0.01) is None
+    saturation = find_saturation([make_level(2.0, 1.95, 2.0), make_level(4.0, 2.5, 4.0)], "open", max_error_rate=0.01)
+    assert (saturation["level"], saturation["last_good_level"]) == (4.0, 2.0)
+    # All requests arrive at once: no arrival rate to compare against
+    assert find_saturation([make_level("replay", 0.1, None)], "open", max_error_rate=0.01) is None
@@ -0,0 +1,75 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("llama_index.core")
+pytest.importorskip("chromadb")
+
+from fastapi import HTTPException
+
+from llama_index.core.schema import QueryBundle, TextNode
+
+
+def test_snapshot_moves_a_collection_between_backends(make_rag_api):
+    source = make_rag_api("persistent")
+    nodes = [
+        TextNode(id_=f"node-{i}", text=f"Paragraph {i} — año fiscal", metadata={"doc_type": "GENERIC", "page": i},
+                 embedding=[float(i == j) for j in range(8)])
+        for i in range(7)
+    ]
+    source.chroma_client.get_vector_store("source_collection").add(nodes)
+    source.chroma_client.get_vector_store("source_collection__summaries").add([
+        TextNode(id_="summary-collection", text="Overview", metadata={"summary_level": "collection"}, embedding=[1.0] * 8)
+    ])
+
+    exported = source.export_collection("source_collection", batch_size=3)
+    assert (exported["count"], exported["dim"], exported["summaries"]) == (7, 8, 1)
+
+    target = make_rag_api("numpy")
+    imported = target.import_collection(target.get_snapshot_path("source_collection"), "restored_collection", batch_size=4)
+    assert imported["collection"] == "restored_collection"
+
+    restored = target.chroma_client.get_or_create_collection("restored_collection").get(ids=["node-5"])
+    assert restored["documents"] == ["Paragraph 5 — año fiscal"]
+    assert restored["metadatas"][0]["page"] == 5
+    # Restored nodes are served by the index without re-embedding
+    retriever = target.get_index("restored_collection").as_retriever(similarity_top_k=1)
+    result = retriever.retrieve(QueryBundle("page five", embedding=[float(j == 5) for j in range(8)]))
+    assert result[0].node.node_id == "node-5"
+    assert target.get_summaries("restored_collection")["collection"] == "Overview"
+
+    with pytest.raises(HTTPException) as error:
+        target.import_collection(target.get_snapshot_path("source_collection"), "restored_collection")
+    assert error.value.status_code == 409
+    with pytest.raises(HTTPException):
+        target.get_snapshot_path("../escape")
+
+
+def test_failed_export_leaves_no_importable_snapshot(make_rag_api, monkeypatch):
+    source = make_rag_api("persistent")
+    source.chroma_client.get_vector_store("source_collection").add([
+        TextNode(id_=f"node-{i}", text=f"Paragraph {i}", embedding=[float(i == j) for j in range(8)])
+        for i in range(4)
+    ])
+    path = source.get_snapshot_path("source_collection")
+    source.export_collection("source_collection", batch_size=2)
+
+    # The re-export dies after overwriting part of the previous snapshot
+    collection = source.chroma_client.get_or_create_collection("source_collection")
+    get = collection.get
+    calls = []
+
+    def failing_get(*args, **kwargs):
+        calls.append(1)
+        if len(calls) > 1:
+            raise ConnectionError("vector store went away")
+        return get(*args, **kwargs)
+
+    monkeypatch.setattr(collection, "get", failing_get)
+    monkeypatch.setattr(source.chroma_client, "get_or_create_collection", lambda name: collection)
+    with pytest.raises(ConnectionError):
+        source.export_collection("source_collection", batch_size=2)
+
+    target = make_rag_api("numpy")
+    with pytest.raises(HTTPException) as error:
+        target.import_collection(path, "restored_collection")
+    assert error.value.status_code == 404
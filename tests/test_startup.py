@@ -0,0 +1,66 @@
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("llama_index.core")
+
+from fastapi.testclient import TestClient
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_import_main_does_not_load_heavy_modules():
+    # A fresh interpreter: the test session has already imported them
+    code = (
+        "import sys, main; "
+        "print(sorted({m.split('.')[0] for m in sys.modules} & {'llama_index', 'chromadb', 'openai'}))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()
+    assert output[-1] == "[]"
+
+
+def test_api_reports_starting_until_the_clients_are_initialized(monkeypatch, tmp_path):
+    import main
+
+    monkeypatch.setattr(main, "state", {"rag_api": None, "ready": False, "error": None, "attempts": 0})
+    monkeypatch.setattr(main, "VECTOR_STORE_BACKEND", "numpy")
+    monkeypatch.setattr(main, "VECTOR_STORE_PATH", str(tmp_path / "vectors"))
+    monkeypatch.setattr(main, "OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(main, "STARTUP_RETRY_DELAY", 0.05)
+
+    # The first attempt fails once the test has seen the API starting, like a
+    # vector store that is not reachable yet
+    build_rag_api = main.build_rag_api
+    release = threading.Event()
+
+    def flaky_build_rag_api():
+        if main.state["attempts"] == 1:
+            release.wait(10)
+            raise ConnectionError("vector store not reachable")
+        return build_rag_api()
+
+    monkeypatch.setattr(main, "build_rag_api", flaky_build_rag_api)
+    headers = {"Authorization": f"Bearer {main.API_TOKEN}"}
+
+    with TestClient(main.app) as client:
+        assert client.get("/healthz").json() == {"status": "alive"}
+        response = client.get("/readyz")
+        assert response.status_code == 503
+        assert response.json()["status"] == "starting"
+        assert client.get("/v1/rag/collections", headers=headers).status_code == 503
+
+        release.set()
+        deadline = time.monotonic() + 10
+        while (response := client.get("/readyz")).status_code != 200 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert response.json() == {"status": "ready"}
+        assert main.state["attempts"] == 2
+        assert client.get("/v1/rag/collections", headers=headers).json()["collections"] == []
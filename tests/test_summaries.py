@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from llama_index.core.schema import Document
+
+from libs.utils import is_overview_question
+
+
+def summarize(api, file_name, doc_type="GENERIC"):
+    docs = [Document(text=f"Content of {file_name}. " * 50, metadata={"doc_type": doc_type})]
+    asyncio.run(api.build_summaries(docs, "summary_collection", doc_type, file_name))
+
+
+def test_summaries_are_stored_per_document_and_per_collection(rag_api):
+    summarize(rag_api, "first.pdf")
+    summarize(rag_api, "second.pdf", doc_type="LEGAL")
+    # Re-summarizing a document replaces its summary
+    summarize(rag_api, "first.pdf")
+
+    summaries = rag_api.get_summaries("summary_collection")
+    assert summaries["collection"] == "Quarterly report"
+    assert sorted(d["file_name"] for d in summaries["documents"]) == ["first.pdf", "second.pdf"]
+    # The companion collection is not listed as a user collection
+    assert rag_api.list_all_collections()["collections"] == []
+
+
+def test_overview_question_is_answered_from_summary_with_one_call(rag_api):
+    summarize(rag_api, "first.pdf")
+
+    result = rag_api.query_documents("What is the document about?", None, "summary_collection", "tree_summarize")
+    assert result["answered_from"] == "summary"
+    assert result["answer"] == "Quarterly report"
+    assert rag_api.llm_query.calls == 1
+    assert result["metadata"][0]["file_name"] == "first.pdf"
+
+    # No summary for this doc_type: fall back to retrieval
+    result = rag_api.query_documents("What is the document about?", "LEGAL", "summary_collection", "compact")
+    assert result["answered_from"] == "retrieval"
+
+
+@pytest.mark.parametrize("question", [
+    "What is this document about?",
+    "Summarize the collection",
+    "Give me an overview of the entire report.",
+    "What are the main points of this paper?",
+    "tl;dr",
+    "¿De qué trata este documento?",
+    "Hazme un resumen",
+])
+def test_whole_document_questions_are_overview_questions(question):
+    assert is_overview_question(question)
+
+
+@pytest.mark.parametrize("question", [
+    "Summarize the refund policy in section 4",
+    "What is the main point of chapter 3?",
+    "Give me a summary of the termination clause",
+    "What does the overview section say about pricing?",
+    "¿De qué trata la sección 4?",
+    "¿Cuál es la idea principal del capítulo 3?",
+])
+def test_section_specific_questions_are_not_overview_questions(question):
+    assert not is_overview_question(question)
+
+
+def test_section_specific_question_is_answered_by_retrieval(rag_api):
+    summarize(rag_api, "first.pdf")
+
+    result = rag_api.query_documents(
+        "Summarize the refund policy in section 4", None, "summary_collection", "compact"
+    )
+    assert result["answered_from"] == "retrieval"